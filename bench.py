@@ -0,0 +1,231 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import checker
+import network
+import nn
+import objio
+import strength
+
+#benchmark cases by name, each one maps a size to a callable doing the timed work once (setup happens before
+#it is returned), sizes are the defaults the suite runs it at and quick the smaller set used with --quick
+benchCases = {}
+
+def registerBench(name, sizes, quick=None):
+    def register(fn):
+        benchCases[name] = (fn, tuple(sizes), tuple(quick or sizes[:1]))
+        return fn
+    return register
+
+#scratch directory for generated meshes, removed on exit
+scratchDir = None
+
+def scratchPath(name):
+    global scratchDir
+    if scratchDir is None:
+        scratchDir = tempfile.mkdtemp(prefix='bench-')
+    return os.path.join(scratchDir, name)
+
+def removeScratch():
+    global scratchDir
+    if scratchDir is not None:
+        shutil.rmtree(scratchDir, True)
+        scratchDir = None
+
+#closed mesh of a rect infill part of the given size, written once per size
+def meshFile(size):
+    path = scratchPath('rect-{}.obj'.format(size))
+    if not os.path.exists(path):
+        objio.save_voxels(checker.generateRectInfill(size, .2), path)
+    return path
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+@registerBench("load_obj", (20, 40, 60))
+def benchLoadObj(size):
+    path = meshFile(size)
+    return lambda: objio.load_obj(path)
+
+@registerBench("load_obj_arrays", (20, 40, 60))
+def benchLoadObjArrays(size):
+    path = meshFile(size)
+    return lambda: objio.load_obj_arrays(path, cache=False)
+
+@registerBench("save_obj", (20, 40, 60))
+def benchSaveObj(size):
+    obj = objio.load_obj(meshFile(size))
+    out = scratchPath('saved-{}.obj'.format(size))
+    return lambda: objio.save_obj(obj, out)
+
+@registerBench("getFace", (20, 40, 60))
+def benchGetFace(size):
+    verts = objio.load_obj(meshFile(size)).vertices
+    return lambda: checker.getFace(2, verts)
+
+@registerBench("generateRectInfill", (50, 125, 250))
+def benchRectInfill(size):
+    return lambda: checker.generateRectInfill(size, .2)
+
+@registerBench("generateGridInfill", (50, 125, 250))
+def benchGridInfill(size):
+    return lambda: checker.generateGridInfill(size, .2, 1)
+
+#size is the number of blocks scored one at a time
+@registerBench("getStr5by5", (10, 100, 1000))
+def benchGetStr5by5(size):
+    blocks = (np.random.default_rng(0).random((size, 5, 5, 5)) < .5).astype(int)
+    def run():
+        for b in blocks:
+            checker.getStr5by5(b)
+    return run
+
+@registerBench("str5by5Batch", (1000, 10000, 100000))
+def benchStr5by5Batch(size):
+    blocks = (np.random.default_rng(0).random((size, 5, 5, 5)) < .5).astype(np.int8)
+    return lambda: strength.str5by5Batch(blocks)
+
+@registerBench("getObjStr", (50, 125, 250))
+def benchGetObjStr(size):
+    obj = checker.generateGridInfill(size, .2, 1)
+    return lambda: checker.getObjStr(obj, size)
+
+@registerBench("getObjStr-loop", (25, 50), quick=(25,))
+def benchGetObjStrLoop(size):
+    obj = checker.generateGridInfill(size, .2, 1)
+    def run():
+        engine = checker.strEngine
+        checker.strEngine = "loop"
+        try:
+            checker.getObjStr(obj, size)
+        finally:
+            checker.strEngine = engine
+    return run
+
+@registerBench("buildObject", (50, 125, 250))
+def benchBuildObject(size):
+    obj = checker.generateGridInfill(size, .2, 1)
+    return lambda: checker.buildObject(obj, size, rng=np.random.default_rng(0), verbose=False)
+
+@registerBench("mixupObj", (50, 125, 250))
+def benchMixupObj(size):
+    obj = checker.generateGridInfill(size, .2, 1)
+    return lambda: checker.mixupObj(obj.copy(), size, np.random.default_rng(0))
+
+@registerBench("totalDiff", (50, 125, 250))
+def benchTotalDiff(size):
+    obj = checker.generateGridInfill(size, .2, 1)
+    mixed = checker.mixupObj(obj.copy(), size, np.random.default_rng(0))
+    return lambda: checker.totalDiff(obj, mixed, size)
+
+#size is the samples per count of drawn cells, nn.py uses 10000
+@registerBench("generateDataset", (1000, 10000, 50000))
+def benchGenerateDataset(size):
+    return lambda: nn.generateDataset(size, rng=np.random.default_rng(0))
+
+#one epoch over generateDataset(size)
+@registerBench("Network.SGD", (1000, 10000))
+def benchSGD(size):
+    data = nn.generateDataset(size, rng=np.random.default_rng(0))
+    def run():
+        np.random.seed(0)
+        net = network.Network([25, 10, 2])
+        quiet(net.SGD, data, 1, 40, 3.0)
+    return run
+
+#one untimed run to warm caches and lazy imports, then the peak traced allocation of a second run and the
+#best wall time over repeat more
+def measure(run, repeat=3):
+    run()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    times = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t)
+    return { 'seconds': min(times), 'peakBytes': int(peak) }
+
+#run the named cases (all of them by default) at their sizes, returns {case: {size: measurement}}
+def runBench(names=None, quick=False, repeat=3, report=print):
+    results = {}
+    for name in names or benchCases:
+        fn, sizes, quickSizes = benchCases[name]
+        results[name] = {}
+        for size in (quickSizes if quick else sizes):
+            #every case starts from an empty block strength cache so it measures the same whatever ran before it
+            strength.blockCache = strength.BlockStrCache(strength.blockCache.maxEntries)
+            result = measure(fn(size), repeat)
+            results[name][str(size)] = result
+            if report:
+                report('{:<20} {:>8} {:>12.6f} s {:>12.1f} KiB'.format(name, size, result['seconds'], result['peakBytes'] / 1024))
+    return results
+
+def environment():
+    return { 'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count() }
+
+def saveBaseline(results, path):
+    with open(path, 'w') as f:
+        json.dump({ 'environment': environment(), 'results': results }, f, indent=1, sort_keys=True)
+
+def loadBaseline(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+#cases slower or hungrier than the baseline by more than the given fractions, times under minSeconds apart are noise
+def findRegressions(results, baseline, timeTolerance=.25, memTolerance=.25, minSeconds=.005):
+    ret = []
+    for name, sizes in results.items():
+        for size, cur in sizes.items():
+            old = baseline.get(name, {}).get(size)
+            if old is None:
+                continue
+            if cur['seconds'] > old['seconds'] * (1 + timeTolerance) and cur['seconds'] - old['seconds'] > minSeconds:
+                ret.append((name, size, 'seconds', old['seconds'], cur['seconds']))
+            if cur['peakBytes'] > old['peakBytes'] * (1 + memTolerance):
+                ret.append((name, size, 'peakBytes', old['peakBytes'], cur['peakBytes']))
+    return ret
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="time and measure peak memory of the checker and network hot paths")
+    parser.add_argument('cases', nargs='*', help="cases to run, all when none are given: " + ", ".join(benchCases))
+    parser.add_argument('--quick', action='store_true', help="run every case at its smallest size only")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case, the best one is kept")
+    parser.add_argument('--save', metavar='JSON', help="write the results as a baseline")
+    parser.add_argument('--compare', metavar='JSON', help="flag regressions against a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=.25, help="allowed slowdown or memory growth as a fraction")
+    args = parser.parse_args(argv)
+    unknown = [ c for c in args.cases if c not in benchCases ]
+    if unknown:
+        parser.error("unknown cases: " + ", ".join(unknown))
+    try:
+        results = runBench(args.cases or None, args.quick, args.repeat)
+    finally:
+        removeScratch()
+    if args.save:
+        saveBaseline(results, args.save)
+    if args.compare:
+        regressions = findRegressions(results, loadBaseline(args.compare), args.tolerance, args.tolerance)
+        for name, size, what, old, cur in regressions:
+            print("REGRESSION {} at {}: {} went from {} to {}".format(name, size, what, old, cur))
+        if regressions:
+            return 1
+        print("no regressions against", args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+import numpy as np
+import checker
+
+#one row per trial in the results of runCampaign
+trialDtype = np.dtype([('trial', np.int64), ('cost', np.int64), ('flaws', np.int64), ('corrected', np.int64)])
+
+#the generator trial number trial of a campaign started with seed uses, the same stream SeedSequence(seed).spawn
+#hands out, so any single trial can be rerun on its own without replaying the ones before it
+def trialRng(seed, trial):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(trial,)))
+
+#object every worker builds, set once per worker process instead of being sent with every trial
+workerObj = None
+workerSize = None
+
+def initWorker(obj, size):
+    global workerObj, workerSize
+    workerObj = obj
+    workerSize = size
+
+#run a single trial on the worker's object
+def runTrial(seed, trial):
+    cost, flaws, corrected = checker.buildObject(workerObj, workerSize, rng=trialRng(seed, trial), verbose=False)
+    return trial, cost, flaws, corrected
+
+#mean, spread and percentiles of every numeric column of the trial table
+def summarize(trials, percentiles=(5, 50, 95)):
+    ret = {}
+    for name in ('cost', 'flaws', 'corrected'):
+        col = trials[name].astype(np.float64)
+        stats = { 'mean': float(col.mean()), 'std': float(col.std()), 'min': float(col.min()), 'max': float(col.max()) }
+        for p, v in zip(percentiles, np.percentile(col, percentiles)):
+            stats['p{}'.format(p)] = float(v)
+        ret[name] = stats
+    return ret
+
+#build obj trials times across a process pool, every trial drawing from its own generator derived from seed
+#returns the per trial table and a summary of cost, flaw and correction counts
+def runCampaign(obj, size, trials, seed=0, workers=None, percentiles=(5, 50, 95)):
+    workers = workers or os.cpu_count()
+    rows = np.zeros(trials, dtype=trialDtype)
+    if trials == 0:
+        return { 'seed': seed, 'trials': rows, 'summary': {} }
+    with multiprocessing.Pool(workers, initializer=initWorker, initargs=(obj, size)) as pool:
+        for i, row in enumerate(pool.starmap(runTrial, [ (seed, t) for t in range(trials) ])):
+            rows[i] = row
+    return { 'seed': seed, 'trials': rows, 'summary': summarize(rows, percentiles) }
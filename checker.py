@@ -2,149 +2,56 @@ import numpy as np
 from decimal import *
 import copy
 import random
+import atexit
+import os
+import strength
+import simulate
+import defects
+import surrogate
+import instrument
+import voxels
+import voxelize
+import infill
+from objio import WavefrontOBJ, load_obj, save_obj
 
 granularity = .01
-
-class WavefrontOBJ:
-    def __init__( self, default_mtl='default_mtl' ):
-        self.path      = None               # path of loaded object
-        self.mtllibs   = []                 # .mtl files references via mtllib
-        self.mtls      = [ default_mtl ]    # materials referenced
-        self.mtlid     = []                 # indices into self.mtls for each polygon
-        self.vertices  = []                 # vertices as an Nx3 or Nx6 array (per vtx colors)
-        self.normals   = []                 # normals
-        self.texcoords = []                 # texture coordinates
-        self.polygons  = []                 # M*Nv*3 array, Nv=# of vertices, stored as vid,tid,nid (-1 for N/A)
-
-def load_obj( filename: str, default_mtl='default_mtl', triangulate=False ) -> WavefrontOBJ:
-    def parse_vertex( vstr ):
-        vals = vstr.split('/')
-        vid = int(vals[0])-1
-        tid = int(vals[1])-1 if len(vals) > 1 and vals[1] else -1
-        nid = int(vals[2])-1 if len(vals) > 2 else -1
-        return (vid,tid,nid)
-
-    with open( filename, 'r' ) as objf:
-        obj = WavefrontOBJ(default_mtl=default_mtl)
-        obj.path = filename
-        cur_mat = obj.mtls.index(default_mtl)
-        for line in objf:
-            toks = line.split()
-            if not toks:
-                continue
-            if toks[0] == 'v':
-                obj.vertices.append( [ float(v) for v in toks[1:]] )
-            elif toks[0] == 'vn':
-                obj.normals.append( [ float(v) for v in toks[1:]] )
-            elif toks[0] == 'vt':
-                obj.texcoords.append( [ float(v) for v in toks[1:]] )
-            elif toks[0] == 'f':
-                poly = [ parse_vertex(vstr) for vstr in toks[1:] ]
-                if triangulate:
-                    for i in range(2,len(poly)):
-                        obj.mtlid.append( cur_mat )
-                        obj.polygons.append( (poly[0], poly[i-1], poly[i] ) )
-                else:
-                    obj.mtlid.append(cur_mat)
-                    obj.polygons.append( poly )
-            elif toks[0] == 'mtllib':
-                obj.mtllibs.append( toks[1] )
-            elif toks[0] == 'usemtl':
-                if toks[1] not in obj.mtls:
-                    obj.mtls.append(toks[1])
-                cur_mat = obj.mtls.index( toks[1] )
-        return obj
-
-def save_obj( obj: WavefrontOBJ, filename: str ):
-    with open( filename, 'w' ) as ofile:
-        for mlib in obj.mtllibs:
-            ofile.write('mtllib {}\n'.format(mlib))
-        for vtx in obj.vertices:
-            ofile.write('v '+' '.join(['{}'.format(v) for v in vtx])+'\n')
-        for tex in obj.texcoords:
-            ofile.write('vt '+' '.join(['{}'.format(vt) for vt in tex])+'\n')
-        for nrm in obj.normals:
-            ofile.write('vn '+' '.join(['{}'.format(vn) for vn in nrm])+'\n')
-        if not obj.mtlid:
-            obj.mtlid = [-1] * len(obj.polygons)
-        poly_idx = np.argsort( np.array( obj.mtlid ) )
-        cur_mat = -1
-        for pid in poly_idx:
-            if obj.mtlid[pid] != cur_mat:
-                cur_mat = obj.mtlid[pid]
-                ofile.write('usemtl {}\n'.format(obj.mtls[cur_mat]))
-            pstr = 'f '
-            for v in obj.polygons[pid]:
-                vstr = '{}/{}/{} '.format(v[0]+1,v[1]+1 if v[1] >= 0 else 'X', v[2]+1 if v[2] >= 0 else 'X' )
-                vstr = vstr.replace('/X/','//').replace('/X ', ' ')
-                pstr += vstr
-            ofile.write( pstr+'\n')
-#courtesy of http://jamesgregson.ca/loadsave-wavefront-obj-files-in-python.html
+#"vector" scores every block in one batched numpy pass, "parallel" splits that pass over strWorkers
+#processes (all cores when None), "surrogate" estimates block strengths with strSurrogate, a trained
+#network (surrogate.loadSurrogate), and "loop" is the original per voxel implementation
+#under "surrogate" the vector and loop builds estimate the blocks the cache has not seen and score them exactly
+#only for close calls, the stream build keeps no finished rows to go back to and always scores exactly
+strEngine = "vector"
+strWorkers = None
+strSurrogate = None
+#worker pool of the "parallel" engine, started on first use and kept until exit
+strPool = None
+#"vector" draws the flaws of a whole layer at once and checks strength once per flawed layer (simulate.py),
+#"stream" does the same one layer at a time holding only a block row of layers (simulate.streamBuild),
+#"loop" is the original per voxel build
+buildEngine = "vector"
 
 #check if value is an edge
 def edge(val, size):
     return (val == 1 or val == size)
 
 #generates 3d object a square infill with given density
-def generateRectInfill(size, density):
-    '''verts = verts2.copy()
-    for i in range(len(verts)):
-        diff = abs(verts[i][0][axis] - verts[i][1][axis])
-        gap = (density * diff)
-        total = int(diff / density / 2)
-        max = verts[i][1][axis]
-        for j in range(total - 1):
-            val = round(max - ((j + 1) * gap), 2)
-            inp = [verts[i][0][0],verts[i][0][1],verts[i][0][2]]
-            inp[axis] = val
-            verts[i].insert(1,inp)
-        print(verts[i])'''
-        
-    total = int(size * density)
-    gap = int(size / total)
-        
-    rows = []
-    
-    for i in range(1, total):
-        rows.append(int(i * gap) + 1)
-    
-    obj = np.zeros((size + 2,size + 2,size + 2), dtype=int)
-    for z in range(1,size+1):
-        for x in range(1,size+1):
-            for y in range(1,size+1):
-                if edge(x, size) or edge(y, size) or edge(z, size):
-                    obj[z][x][y] = 1
-                if (x in rows) or (y in rows):
-                    obj[z][x][y] = 1
-                    
-    return obj
+#kind picks the volume storage, see voxels.volumeKinds
+def generateRectInfill(size, density, kind="int"):
+    with instrument.current.phase("generation"):
+        return infill.buildInfill("rect", size, density, kind)
            
 #generates 3d object an x shaped infill with given density         
-def generateGridInfill(size, density, slope):
-    total = int(size * density)
-    gap = int(size / total)
-        
-    rows = []
-    
-    for i in range(-total, 2*total+1):
-        rows.append(int(i * gap) + 1)
-    
-    obj = np.zeros((size + 2,size + 2,size + 2), dtype=int)
-    for z in range(1,size+2):
-        for x in range(1,size+2):
-            for y in range(1,size+2):
-                if edge(x, size) or edge(y, size) or edge(z, size):
-                    obj[z][x][y] = 1
-                for r in rows:
-                    if ((int((x-1)*slope) + r == y) or (int((-1/slope)*(x-1)) + r == y)) and y != size + 1:
-                        obj[z][x][y] = 1
-                        break
-    return obj
+def generateGridInfill(size, density, slope, kind="int"):
+    with instrument.current.phase("generation"):
+        return infill.buildInfill("grid", size, density, kind, slope=slope)
             
 #tests to be run for all values
-def generateInfill(vertpairs):
+#when a mesh is given the infill is clipped to its inside
+def generateInfill(vertpairs, mesh=None):
     #rect
     o1 = generateRectInfill(125, .2)
+    if mesh is not None:
+        o1 = voxelize.fillMesh(mesh, o1, 125)
 #     o1Mixup = copy.deepcopy(o1)
 #     o1Mixup = mixupObj(o1Mixup, 125)
 #     print("01 diff ",totalDiff(o1, o1Mixup, 125))
@@ -153,6 +60,8 @@ def generateInfill(vertpairs):
     
     #grid
     o2 = generateGridInfill(125, .2, 1)
+    if mesh is not None:
+        o2 = voxelize.fillMesh(mesh, o2, 125)
     buildObject(o2,125)
     #o2Mixup = copy.deepcopy(o2)
     #o2Mixup = mixupObj(o2Mixup, 125)
@@ -162,44 +71,131 @@ def generateInfill(vertpairs):
     
 #every time there is a shift over there is a chance that there will be a mechanical error resulting in a skipped spot, 
 #this will lead to recalculating the str of the object and then determining if the differences will cause significant str changes
-def buildObject(obj, size):
-    newObj = np.zeros((size + 2,size + 2,size + 2), dtype=int)
+#rng is a numpy Generator to draw deviations from instead of the global random module, flawRate is the chance
+#of a deviation per voxel and correctionCost what patching one adds to the cost
+#returns the cost, the number of flaws and how many of them were corrected
+#flaws are reported to instrument.current as events, verbose only prints the final cost
+def buildObject(obj, size, rng=None, verbose=True, flawRate=.01, correctionCost=7):
+    ins = instrument.current
+    if buildEngine in ("vector", "stream"):
+        if rng is None:
+            rng = np.random.default_rng(random.getrandbits(64))
+        if buildEngine == "vector":
+            sur = needSurrogate() if strEngine == "surrogate" else None
+            cost, amtFlaws, corrected = simulate.simulateBuild(obj, size, rng, flawRate, correctionCost, sur=sur)
+        else:
+            records = np.fromiter(simulate.streamBuild(obj, size, rng, flawRate, correctionCost), dtype=simulate.layerDtype)
+            cost, amtFlaws, corrected = (int(records[name].sum()) for name in ('cost', 'flaws', 'corrected'))
+    else:
+        cost, amtFlaws, corrected = loopBuild(obj, size, rng, flawRate, correctionCost)
+    ins.event("build", size=size, cost=cost, flaws=amtFlaws, corrected=corrected)
+    if verbose:
+        print("object cost to build was",cost,"supposed to be",size*size*size,"but had to correct",amtFlaws,"flaws")
+    return cost, amtFlaws, corrected
+
+#the original per voxel build
+def loopBuild(obj, size, rng, flawRate, correctionCost):
+    ins = instrument.current
+    newObj = voxels.zerosLike(obj)
     cost = 0
     amtFlaws = 0
-    for z in range(1, size+1):
-        for x in range(1, size+1):
-            for y in range(1, size+1):
-                r = random.randint(0,99)
-                yModifier = 0
-                if r < 1:
-                    yModifier = 1
-                newObj[z][x][y] = 0
-                newObj[z][x][y + yModifier] = 1
-                cost += 1
-                if yModifier == 1:
-                    putInNew = testRestOfObjForStr(obj, newObj, z, x, y, size)
-                    amtFlaws += 1
-                    if putInNew:
-                        cost += 7
-                        newObj[z][x][y] = 1
-                y+= yModifier
-    print("object cost to build was",cost,"supposed to be",size*size*size,"but had to correct",amtFlaws,"flaws")
+    corrected = 0
+    tracker = None
+    if strEngine in ("vector", "parallel"):
+        with ins.phase("strength"):
+            tracker = strength.IncrementalStr(obj, size)
+    elif strEngine == "surrogate":
+        with ins.phase("strength"):
+            tracker = surrogate.ScreenedStr(needSurrogate(), obj, size)
+    with ins.phase("deposition"):
+        for z in range(1, size+1):
+            for x in range(1, size+1):
+                for y in range(1, size+1):
+                    if rng is None:
+                        r = random.randint(0,99)
+                    else:
+                        r = rng.integers(0,100)
+                    yModifier = 0
+                    if r < flawRate*100:
+                        yModifier = 1
+                    newObj[z][x][y] = 0
+                    newObj[z][x][y + yModifier] = 1
+                    cost += 1
+                    if yModifier == 1:
+                        putInNew = testRestOfObjForStr(obj, newObj, z, x, y, size, tracker)
+                        amtFlaws += 1
+                        ins.count("flaws")
+                        if putInNew:
+                            with ins.phase("correction"):
+                                cost += correctionCost
+                                corrected += 1
+                                newObj[z][x][y] = 1
+                            ins.count("corrections")
+                    y+= yModifier
+    return cost, amtFlaws, corrected
 
 #assuming no other printing errors will occur copy the rest of the object to the current object and compare strengths
-def testRestOfObjForStr(obj, newObj, z, x, y, size):
+#a tracker built from obj only rescores the blocks that changed since the previous flaw
+#every test is reported to instrument.current as a "flaw" event
+def testRestOfObjForStr(obj, newObj, z, x, y, size, tracker=None):
     strThresh = 5
-    newObj[z][x][y+2:size+2] = obj[z][x][y+2:size+2]
-    newObj[z][x:size+2][0:size+2] = obj[z][x:size+2][0:size+2]
-    newObj[z:size+2][0:size+2][0:size+2] = obj[z:size+2][0:size+2][0:size+2]
-    str = getObjStr(newObj,size)
-    strOld = getObjStr(obj,size)
-    print("strength with flaw ", str, " str w/o flaw ", strOld)
-    if strOld - str < strThresh and strOld > str:
-        return True
-    return False
+    ins = instrument.current
+    with ins.phase("strength"):
+        newObj[z][x][y+2:size+2] = obj[z][x][y+2:size+2]
+        newObj[z][x:size+2][0:size+2] = obj[z][x:size+2][0:size+2]
+        voxels.copyLayers(newObj, obj, z, size+2)
+        exact = True
+        if tracker is not None:
+            #a surrogate tracker (surrogate.ScreenedStr) only scores exactly the changed blocks a close call needs
+            ins.count("strengthCalls")
+            tracker.advance(newObj, z)
+            loss, exact = tracker.loss(strThresh)
+            str = tracker.total
+            strOld = tracker.refTotal
+        else:
+            str = getObjStr(newObj,size)
+            strOld = getObjStr(obj,size)
+    ret = strOld - str < strThresh and strOld > str
+    ins.event("flaw", z=z, x=x, y=y, str=str, strOld=strOld, exact=exact, corrected=ret)
+    return ret
+
+def needSurrogate():
+    if strSurrogate is None:
+        raise ValueError("strEngine \"surrogate\" needs a trained network in checker.strSurrogate")
+    return strSurrogate
+
+#the shared worker pool, restarted only when strWorkers changes
+def needStrPool():
+    global strPool
+    workers = strWorkers or os.cpu_count()
+    if strPool is not None and strPool.workers != workers:
+        closeStrPool()
+    if strPool is None:
+        strPool = strength.ParallelStr(workers)
+    return strPool
+
+def closeStrPool():
+    global strPool
+    if strPool is not None:
+        strPool.close()
+        strPool = None
+
+atexit.register(closeStrPool)
 
 #get the strength of a full object
 def getObjStr(o1,size):
+    instrument.current.count("strengthCalls")
+    with instrument.current.phase("strength"):
+        return engineObjStr(o1, size)
+
+#strength of a full object with the engine strEngine picks
+def engineObjStr(o1,size):
+    if strEngine == "vector":
+        return strength.objStr(o1, size)
+    if strEngine == "parallel":
+        return needStrPool().objStr(o1, size)
+    if strEngine == "surrogate":
+        return needSurrogate().objStr(o1, size)
     oTemp = o1[1:size+1,1:size+1,1:size+1]
     for i in range(2):
         ret = np.zeros((int(len(oTemp)/5),int(len(oTemp)/5),int(len(oTemp)/5)),dtype=int)
@@ -215,19 +211,12 @@ def getObjStr(o1,size):
         oTemp = ret
     return np.sum(oTemp)
     
-#shuffle object
-def mixupObj(obj, size):
-    for z in range(1, size+1):
-        for x in range(1, size+1):
-            for y in range(1, size+1):
-                r = random.randint(0,99)
-                if r < 10 and obj[z][x][y] == 1:
-                    obj[z][x][y] = 0
-                    x1 = random.randint(-1,1)
-                    y1 = random.randint(-1,1)
-                    z1 = random.randint(-1,1)
-                    obj[z + z1][x + x1][y + y1] = 1
-    return obj
+#shuffle object: about 10% of the filled voxels land one voxel off in a random direction
+#see defects.py for the other defect models
+def mixupObj(obj, size, rng=None):
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    return defects.injectDefects(obj, size, "shift", rng, rate=.1)
 
 #range check
 def outofrange(size, z1, x1, y1, z, x, y):
@@ -296,38 +285,42 @@ def getStr5by5(inp):
 
 #measure differences between 2 objects
 def totalDiff(og, o2, size):
-    diff = 0
-    for z in range(1, size+2):
-        for x in range(1, size+2):
-            for y in range(1, size+2):
-                if(og[z][x][y] != o2[z][x][y]):
-                    diff += 1
-    return diff
+    return defects.diffCount(og, o2, size)
     
+#group vertices by their axis coordinate rounded to tol (granularity by default)
+#returns the vertices sorted by group, in order of each group's first appearance, and sorted within a group,
+#plus the offsets where each group starts after the first
+def faceIndex(axis, verts, tol=None):
+    if tol is None:
+        tol = granularity
+    v = np.asarray(verts, dtype=float).reshape(len(verts), -1)
+    keys = np.round(v[:,axis] / tol).astype(np.int64)
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    group = np.argsort(np.argsort(first))[inverse.ravel()]
+    order = np.lexsort(tuple(v.T[::-1]) + (group,))
+    bounds = np.flatnonzero(np.diff(group[order])) + 1
+    return v[order], bounds
+
 #get diffreent faces of an obj file
-def getFace(axis, verts):
-    allRet = []
-    for i in range(len(verts)):
-        tempRet = []
-        if not verts[i] in allRet:
-            tempRet.append(verts[i])
-        for j in range(len(verts)):
-            if i != j:
-                if verts[i][axis] == verts[j][axis] and not verts[j] in allRet:
-                    tempRet.append(verts[j])
-        tempRet.sort()
-        if not tempRet in allRet:
-            allRet.append(tempRet)
-    return allRet
+def getFace(axis, verts, tol=None):
+    if len(verts) == 0:
+        return []
+    v, bounds = faceIndex(axis, verts, tol)
+    return [g.tolist() for g in np.split(v, bounds)]
     
             
-cube = load_obj("cube.obj")
+#load the cube, split it into faces and run every infill test on it
+def main():
+    cube = load_obj("cube.obj", triangulate=True)
+
+    f = getFace(2,cube.vertices)
+    infillInput = []
+    for face in f:
+        f2 = getFace(1, face)
+        for i in f2:
+            infillInput.append(i)
 
-f = getFace(2,cube.vertices)
-infillInput = []
-for face in f:
-    f2 = getFace(1, face)
-    for i in f2:
-        infillInput.append(i)
+    generateInfill(infillInput, cube)
 
-generateInfill(infillInput)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
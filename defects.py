@@ -0,0 +1,102 @@
+import numpy as np
+
+#defect models by name, each one takes a dense volume, the (F,3) z,x,y coordinates of its filled inner voxels
+#and a numpy Generator and applies its defects to the volume in place
+defectModels = {}
+
+#decorator adding a defect model to defectModels
+def registerDefect(name):
+    def register(fn):
+        defectModels[name] = fn
+        return fn
+    return register
+
+#coordinates of the filled voxels in the inner region 1..size, the voxels mixupObj visits
+def filledSites(vol, size):
+    inner = np.asarray(vol[1:size+1,1:size+1,1:size+1]) == 1
+    return np.argwhere(inner) + 1
+
+#each site independently with probability rate, drawn as a binomial count of distinct sites
+def sampleSites(sites, rate, rng):
+    k = rng.binomial(len(sites), rate)
+    return sites[rng.choice(len(sites), k, replace=False)]
+
+def clipCoords(coords, shape):
+    return np.clip(coords, 0, np.array(shape[:3]) - 1)
+
+#drop: a sampled voxel is not printed
+@registerDefect("drop")
+def dropDefects(vol, sites, rng, rate=.1):
+    picked = sampleSites(sites, rate, rng)
+    vol[tuple(picked.T)] = 0
+
+#shift: a sampled voxel lands up to reach voxels off along each axis (possibly in place), clipped to the volume
+#all sampled voxels are cleared before any is placed, so one landing on another sampled site stays
+@registerDefect("shift")
+def shiftDefects(vol, sites, rng, rate=.1, reach=1):
+    picked = sampleSites(sites, rate, rng)
+    vol[tuple(picked.T)] = 0
+    target = clipCoords(picked + rng.integers(-reach, reach+1, size=picked.shape), vol.shape)
+    vol[tuple(target.T)] = 1
+
+#cluster: voids, every voxel within radius (along each axis) of a sampled center is cleared
+@registerDefect("cluster")
+def clusterDefects(vol, sites, rng, rate=.001, radius=1):
+    centers = sampleSites(sites, rate, rng)
+    r = np.arange(-radius, radius+1)
+    offsets = np.stack(np.meshgrid(r, r, r, indexing='ij'), axis=-1).reshape(-1, 3)
+    cleared = clipCoords((centers[:,None,:] + offsets[None,:,:]).reshape(-1, 3), vol.shape)
+    vol[tuple(cleared.T)] = 0
+
+#apply a defect model to obj in place and return it, params go to the model (rate, reach, radius)
+#volumes that are not numpy arrays are expanded once and written back
+def injectDefects(obj, size, model="shift", rng=None, **params):
+    if rng is None:
+        rng = np.random.default_rng()
+    vol = obj if isinstance(obj, np.ndarray) else np.asarray(obj)
+    defectModels[model](vol, filledSites(vol, size), rng, **params)
+    if vol is not obj:
+        obj[:] = vol
+    return obj
+
+#count defective copies of obj, copy i drawing from SeedSequence(seed) spawn i so any one can be rebuilt alone
+#the filled sites are found once for all copies
+def defectVariants(obj, size, count, model="shift", seed=0, **params):
+    base = np.asarray(obj)
+    sites = filledSites(base, size)
+    for i in range(count):
+        vol = base.copy()
+        defectModels[model](vol, sites, np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(i,))), **params)
+        yield vol
+
+def diffRegion(a, b, size):
+    return np.asarray(a[1:size+2,1:size+2,1:size+2]) != np.asarray(b[1:size+2,1:size+2,1:size+2])
+
+#number of voxels that differ over indices 1..size+1, what totalDiff counts
+def diffCount(a, b, size):
+    return int(np.count_nonzero(diffRegion(a, b, size)))
+
+#(N,3) z,x,y coordinates of the differing voxels, in volume indices
+def diffCoords(a, b, size):
+    return np.argwhere(diffRegion(a, b, size)) + 1
+
+#differing voxels per layer, entry z for layer z (layer 0 is outside the compared region and stays 0)
+def diffLayers(a, b, size):
+    ret = np.zeros(size+2, dtype=np.int64)
+    ret[1:] = np.count_nonzero(diffRegion(a, b, size), axis=(1,2))
+    return ret
+
+#all of the above in one pass, plus how many voxels b filled or emptied compared to a
+def volumeDiff(a, b, size):
+    va = np.asarray(a[1:size+2,1:size+2,1:size+2])
+    vb = np.asarray(b[1:size+2,1:size+2,1:size+2])
+    changed = va != vb
+    layers = np.zeros(size+2, dtype=np.int64)
+    layers[1:] = np.count_nonzero(changed, axis=(1,2))
+    return {
+        'count':   int(layers.sum()),
+        'added':   int(np.count_nonzero(changed & (vb == 1))),
+        'removed': int(np.count_nonzero(changed & (va == 1))),
+        'coords':  np.argwhere(changed) + 1,
+        'layers':  layers,
+    }
@@ -0,0 +1,116 @@
+import numpy as np
+import voxels
+
+#infill patterns by name, each one maps (size, density, **params) to its unit cell and the last index the
+#pattern fills (size, or size+1 for the grid). The cell is either one (size+2)^2 cross-section shared by every
+#layer between the top and bottom shell, or a (period, size+2, size+2) stack whose layers repeat along z from layer 1
+infillPatterns = {}
+
+#decorator adding a unit cell function to infillPatterns
+def registerInfill(name):
+    def register(fn):
+        infillPatterns[name] = fn
+        return fn
+    return register
+
+#row spacing used by every pattern, int(size * density) rows gap voxels apart
+def rowGap(size, density):
+    total = int(size * density)
+    gap = int(size / total)
+    return total, gap
+
+#mask of indices 0..size+1 that lie on the shell, index 1 or size
+def edgeMask(size):
+    mask = np.zeros(size + 2, dtype=bool)
+    mask[1] = True
+    mask[size] = True
+    return mask
+
+#rect: straight walls along x and y at 1+gap, 1+2*gap, ... up to the last of total-1 rows
+@registerInfill("rect")
+def rectSection(size, density):
+    total, gap = rowGap(size, density)
+    rows = edgeMask(size)
+    rows[1+gap:(total-1)*gap+2:gap] = True
+    section = rows[:,None] | rows[None,:]
+    section[0,:] = section[:,0] = False
+    section[size+1,:] = section[:,size+1] = False
+    return section, size
+
+#grid: diagonals y = int((x-1)*slope) + r and y = int((-1/slope)*(x-1)) + r for every row offset
+#r = i*gap+1 with -total <= i <= 2*total, over indices 1..size+1 with no diagonal at y = size+1
+@registerInfill("grid")
+def gridSection(size, density, slope):
+    total, gap = rowGap(size, density)
+    inv = -1/slope
+    idx = np.arange(size + 2)
+    x = idx[:,None]
+    y = idx[None,:]
+    diag = np.zeros((size + 2, size + 2), dtype=bool)
+    for offset in (np.trunc((idx - 1) * slope), np.trunc(inv * (idx - 1))):
+        d = y - offset.astype(np.int64)[:,None] - 1
+        diag |= (d % gap == 0) & (d // gap >= -total) & (d // gap <= 2*total)
+    diag[:, size+1] = False
+    edges = edgeMask(size)
+    section = diag | edges[:,None] | edges[None,:]
+    inside = (x >= 1) & (y >= 1)
+    return section & inside, size + 1
+
+#gyroid: the surface sin(x)cos(y) + sin(y)cos(z) + sin(z)cos(x) = 0 about one voxel thick, one period every
+#2*gap voxels (at least 6, shorter periods cannot resolve the surface) so its walls are about as far apart as
+#rect's, inside the same outer walls as rect
+@registerInfill("gyroid")
+def gyroidCell(size, density):
+    total, gap = rowGap(size, density)
+    period = max(6, 2 * gap)
+    k = 2 * np.pi / period
+    t = (np.arange(size + 2) - 1) * k
+    z = t[:period,None,None]
+    x = t[None,:,None]
+    y = t[None,None,:]
+    f = np.sin(x)*np.cos(y) + np.sin(y)*np.cos(z) + np.sin(z)*np.cos(x)
+    edges = edgeMask(size)
+    cell = (np.abs(f) < .6 * k) | edges[:,None] | edges[None,:]
+    cell[:,0,:] = cell[:,:,0] = False
+    cell[:,size+1,:] = cell[:,:,size+1] = False
+    return cell, size
+
+#layer z >= 1 of a pattern's unit cell
+def cellLayer(cell, z):
+    if cell.ndim == 2:
+        return cell
+    return cell[(z - 1) % len(cell)]
+
+#fill a (size+2)^3 volume with a registered pattern, every layer from 1 to the pattern's last index
+#gets its layer of the unit cell and the shell layers 1 and size are filled solid over the same extent
+def buildInfill(name, size, density, kind="int", **params):
+    cell, hi = infillPatterns[name](size, density, **params)
+    solid = np.zeros((size + 2, size + 2), dtype=bool)
+    solid[1:hi+1, 1:hi+1] = True
+    obj = voxels.zeros((size + 2, size + 2, size + 2), kind)
+    if isinstance(obj, np.ndarray):
+        if cell.ndim == 2:
+            obj[1:hi+1] = cell
+        else:
+            for p in range(len(cell)):
+                obj[1+p:hi+1:len(cell)] = cell[p]
+        obj[1] = solid
+        obj[size] = solid
+        return obj
+    for z in range(1, hi + 1):
+        obj[z] = solid if (z == 1 or z == size) else cellLayer(cell, z)
+    return obj
+
+#the layers 0..size+1 of buildInfill(name, ...) one at a time, for consumers that stream a part instead of holding it
+def infillLayers(name, size, density, **params):
+    cell, hi = infillPatterns[name](size, density, **params)
+    solid = np.zeros((size + 2, size + 2), dtype=bool)
+    solid[1:hi+1, 1:hi+1] = True
+    empty = np.zeros((size + 2, size + 2), dtype=bool)
+    for z in range(size + 2):
+        if z == 0 or z > hi:
+            yield empty
+        elif z == 1 or z == size:
+            yield solid
+        else:
+            yield cellLayer(cell, z)
@@ -0,0 +1,196 @@
+import cProfile
+import collections
+import contextlib
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+import strength
+
+#phases the pipeline reports: volume generation, voxel deposition, strength evaluation and flaw correction
+phases = ("generation", "deposition", "strength", "correction")
+
+#sinks receive every event as a dict with at least 'event' and 't' (seconds since the instrument started)
+class NullSink:
+    def emit( self, event ):
+        pass
+
+    def close( self ):
+        pass
+
+#keeps every event in memory, for tests and notebooks
+class MemorySink:
+    def __init__( self ):
+        self.events = []
+
+    def emit( self, event ):
+        self.events.append(event)
+
+    def close( self ):
+        pass
+
+#one json object per line, to a path (opened here and closed with the sink) or an open text file
+class JsonLinesSink:
+    def __init__( self, target ):
+        self.owned = isinstance(target, str)
+        self.file  = open(target, 'w') if self.owned else target
+
+    def emit( self, event ):
+        self.file.write(json.dumps(event, default=jsonValue) + '\n')
+
+    def close( self ):
+        if self.owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+#one readable line per event, what the pipeline used to print
+class PrintSink:
+    def __init__( self, file=None ):
+        self.file = file
+
+    def emit( self, event ):
+        fields = ' '.join('{}={}'.format(k, v) for k, v in event.items() if k not in ('event', 't'))
+        print(event['event'], fields, file=self.file or sys.stdout)
+
+    def close( self ):
+        pass
+
+#numpy scalars and arrays in events
+def jsonValue(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError("cannot serialize {!r}".format(value))
+
+#per phase timers and counters of a run, with events sent to sink
+#phase times are exclusive: time spent in a phase nested in another is only counted for the inner one
+#phases named in profile run under their own cProfile.Profile, phases named in traceMemory get their peak
+#traced allocation (above what was allocated on entry) recorded, tracemalloc is started for them if needed
+#an instrument made with enabled=False does nothing, that is the one the pipeline uses by default
+class Instrument:
+    def __init__( self, sink=None, profile=(), traceMemory=(), enabled=True ):
+        self.enabled     = enabled
+        self.sink        = sink or NullSink()
+        self.profile     = set(profile)
+        self.traceMemory = set(traceMemory)
+        self.timers      = collections.defaultdict(float)   # phase -> seconds
+        self.entries     = collections.defaultdict(int)     # phase -> times entered
+        self.counters    = collections.defaultdict(int)
+        self.profiles    = {}                               # phase -> cProfile.Profile
+        self.peaks       = {}                               # phase -> peak bytes
+        self.stack       = []                               # active phases as [name, start, profiler, trace]
+        self.started     = time.perf_counter()
+        self.cache       = strength.blockCache
+        self.cacheStart  = self.cache.stats() if self.cache is not None else None
+        self.ownTrace    = False
+
+    def now( self ):
+        return time.perf_counter() - self.started
+
+    def count( self, name, n=1 ):
+        if self.enabled:
+            self.counters[name] += n
+
+    def event( self, kind, **fields ):
+        if self.enabled:
+            fields['event'] = kind
+            fields['t'] = self.now()
+            self.sink.emit(fields)
+
+    def phase( self, name ):
+        if not self.enabled:
+            return noPhase
+        return self.timedPhase(name)
+
+    @contextlib.contextmanager
+    def timedPhase( self, name ):
+        t = time.perf_counter()
+        if self.stack:
+            outer = self.stack[-1]
+            self.timers[outer[0]] += t - outer[1]
+            if outer[2] is not None:
+                outer[2].disable()
+        profiler = None
+        if name in self.profile:
+            profiler = self.profiles.setdefault(name, cProfile.Profile())
+        trace = None
+        if name in self.traceMemory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.ownTrace = True
+            for frame in self.stack:        # fold the current peak into the outer phases before resetting it
+                if frame[3] is not None:
+                    frame[3][1] = max(frame[3][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            trace = [tracemalloc.get_traced_memory()[0], 0]
+        frame = [name, time.perf_counter(), profiler, trace]
+        self.stack.append(frame)
+        self.entries[name] += 1
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            t = time.perf_counter()
+            self.timers[name] += t - frame[1]
+            self.stack.pop()
+            if trace is not None:
+                peak = max(trace[1], tracemalloc.get_traced_memory()[1]) - trace[0]
+                self.peaks[name] = max(self.peaks.get(name, 0), peak)
+                for outer in self.stack:
+                    if outer[3] is not None:
+                        outer[3][1] = max(outer[3][1], tracemalloc.get_traced_memory()[1])
+            if self.stack:
+                outer = self.stack[-1]
+                outer[1] = t
+                if outer[2] is not None:
+                    outer[2].enable()
+
+    #block strength cache hits and misses since the instrument was made
+    def cacheCounts( self ):
+        if self.cache is None:
+            return {}
+        now = self.cache.stats()
+        return { 'cacheHits': now['hits'] - self.cacheStart['hits'], 'cacheMisses': now['misses'] - self.cacheStart['misses'] }
+
+    def summary( self ):
+        counters = dict(self.counters)
+        counters.update(self.cacheCounts())
+        return { 'seconds': self.now(), 'phases': dict(self.timers), 'entries': dict(self.entries),
+                 'counters': counters, 'peakBytes': dict(self.peaks) }
+
+    #pstats of a profiled phase, sorted by cumulative time
+    def profileStats( self, name, stream=None ):
+        return pstats.Stats(self.profiles[name], stream=stream or io.StringIO()).sort_stats('cumulative')
+
+    #emit the summary, close the sink and stop tracemalloc if this instrument started it
+    def finish( self ):
+        if not self.enabled:
+            return
+        self.event('summary', **self.summary())
+        self.sink.close()
+        if self.ownTrace:
+            tracemalloc.stop()
+            self.ownTrace = False
+
+noPhase = contextlib.nullcontext()
+
+#instrument the pipeline reports to, disabled unless a run installs its own with use()
+disabled = Instrument(enabled=False)
+current = disabled
+
+#install ins as the current instrument for the duration of a with block and finish it at the end
+@contextlib.contextmanager
+def use(ins):
+    global current
+    previous = current
+    current = ins
+    try:
+        yield ins
+    finally:
+        current = previous
+        ins.finish()
@@ -17,7 +17,7 @@ import numpy as np
 
 class Network(object):
 
-    def __init__(self, sizes):
+    def __init__(self, sizes, dtype=np.float64):
         """The list ``sizes`` contains the number of neurons in the
         respective layers of the network.  For example, if the list
         was [2, 3, 1] then it would be a three-layer network, with the
@@ -27,19 +27,37 @@ class Network(object):
         distribution with mean 0, and variance 1.  Note that the first
         layer is assumed to be an input layer, and by convention we
         won't set any biases for those neurons, since biases are only
-        ever used in computing the outputs from later layers."""
+        ever used in computing the outputs from later layers.
+
+        ``dtype`` is the floating point type of the weights, biases
+        and the batches they are trained on; ``np.float32`` halves
+        the memory traffic of training.  The gradient buffers used by
+        ``backprop_batch`` are allocated here once."""
         self.num_layers = len(sizes)
         self.sizes = sizes
-        self.biases = [np.random.randn(y, 1) for y in sizes[1:]]
-        self.weights = [np.random.randn(y, x)
+        self.dtype = np.dtype(dtype)
+        self.biases = [np.random.randn(y, 1).astype(self.dtype)
+                       for y in sizes[1:]]
+        self.weights = [np.random.randn(y, x).astype(self.dtype)
                         for x, y in zip(sizes[:-1], sizes[1:])]
+        self.nabla_b = [np.zeros(b.shape, dtype=self.dtype)
+                        for b in self.biases]
+        self.nabla_w = [np.zeros(w.shape, dtype=self.dtype)
+                        for w in self.weights]
 
     def feedforward(self, a):
-        """Return the output of the network if ``a`` is input."""
+        """Return the output of the network if ``a`` is input.  ``a``
+        may also hold one input per column, in which case the outputs
+        come back one per column as well."""
         for b, w in zip(self.biases, self.weights):
             a = sigmoid(np.dot(w, a)+b)
         return a
 
+    def predict(self, X):
+        """Return the index of the most active output neuron for every
+        column of ``X``."""
+        return np.argmax(self.feedforward(X), axis=0)
+
     def SGD(self, training_data, epochs, mini_batch_size, eta,
             test_data=None):
         """Train the neural network using mini-batch stochastic
@@ -49,37 +67,75 @@ class Network(object):
         self-explanatory.  If ``test_data`` is provided then the
         network will be evaluated against the test data after each
         epoch, and partial progress printed out.  This is useful for
-        tracking progress, but slows things down substantially."""
-        if test_data: n_test = len(test_data)
-        n = len(training_data)
+        tracking progress, but slows things down substantially.
+
+        Either data set may also be given as a tuple ``(X, Y)`` of
+        arrays holding one sample per column (see ``as_matrices``).
+        The training data is stacked into one matrix up front and
+        every mini-batch is a single matrix-matrix pass through
+        ``update_batch``."""
+        X, Y = self.as_matrices(training_data)
+        if test_data:
+            test_data = self.as_matrices(test_data)
+            n_test = test_data[0].shape[1]
+        for j in range(epochs):
+            self.train_chunk(X, Y, mini_batch_size, eta)
+            if test_data:
+                print("Epoch {}: {} / {}".format(
+                    j, self.evaluate(test_data), n_test))
+            else:
+                print("Epoch {0} complete",j)
+
+    def SGD_stream(self, chunks, epochs, mini_batch_size, eta,
+                   test_data=None):
+        """Like ``SGD``, but for training data that need not fit in
+        memory.  ``chunks`` is called once per epoch and returns an
+        iterable of ``(X, Y)`` array pairs, one sample per column,
+        such as ``nn.datasetChunks``.  Each chunk is shuffled and cut
+        into mini-batches on its own, so only one chunk is held at a
+        time; chunks should mix the kinds of samples well for the
+        shuffle to stand in for shuffling the whole set."""
+        if test_data:
+            test_data = self.as_matrices(test_data)
+            n_test = test_data[0].shape[1]
         for j in range(epochs):
-            np.random.shuffle(training_data)
-            mini_batches = [
-                training_data[k:k+mini_batch_size]
-                for k in range(0, n, mini_batch_size)]
-            for mini_batch in mini_batches:
-                self.update_mini_batch(mini_batch, eta)
+            for chunk in chunks():
+                X, Y = self.as_matrices(chunk)
+                self.train_chunk(X, Y, mini_batch_size, eta)
             if test_data:
                 print("Epoch {}: {} / {}".format(
                     j, self.evaluate(test_data), n_test))
             else:
                 print("Epoch {0} complete",j)
 
+    def train_chunk(self, X, Y, mini_batch_size, eta):
+        """Shuffle the columns of ``X`` and ``Y`` and apply
+        ``update_batch`` to each mini-batch of them in turn."""
+        n = X.shape[1]
+        order = np.random.permutation(n)
+        X, Y = X[:, order], Y[:, order]
+        for k in range(0, n, mini_batch_size):
+            self.update_batch(X[:, k:k+mini_batch_size],
+                              Y[:, k:k+mini_batch_size], eta)
+
     def update_mini_batch(self, mini_batch, eta):
         """Update the network's weights and biases by applying
         gradient descent using backpropagation to a single mini batch.
         The ``mini_batch`` is a list of tuples ``(x, y)``, and ``eta``
         is the learning rate."""
-        nabla_b = [np.zeros(b.shape) for b in self.biases]
-        nabla_w = [np.zeros(w.shape) for w in self.weights]
-        for x, y in mini_batch:
-            delta_nabla_b, delta_nabla_w = self.backprop(x, y)
-            nabla_b = [nb+dnb for nb, dnb in zip(nabla_b, delta_nabla_b)]
-            nabla_w = [nw+dnw for nw, dnw in zip(nabla_w, delta_nabla_w)]
-        self.weights = [w-(eta/len(mini_batch))*nw
-                        for w, nw in zip(self.weights, nabla_w)]
-        self.biases = [b-(eta/len(mini_batch))*nb
-                       for b, nb in zip(self.biases, nabla_b)]
+        X, Y = self.as_matrices(mini_batch)
+        self.update_batch(X, Y, eta)
+
+    def update_batch(self, X, Y, eta):
+        """Batched form of ``update_mini_batch``: ``X`` holds one
+        input per column and ``Y`` the matching desired outputs.  The
+        weights and biases are updated in place."""
+        nabla_b, nabla_w = self.backprop_batch(X, Y)
+        scale = eta/X.shape[1]
+        for w, nw in zip(self.weights, nabla_w):
+            w -= scale*nw
+        for b, nb in zip(self.biases, nabla_b):
+            b -= scale*nb
 
     def backprop(self, x, y):
         """Return a tuple ``(nabla_b, nabla_w)`` representing the
@@ -116,20 +172,89 @@ class Network(object):
             nabla_w[-l] = np.dot(delta, activations[-l-1].transpose())
         return (nabla_b, nabla_w)
 
+    def backprop_batch(self, X, Y):
+        """Batched form of ``backprop``: the forward and backward
+        passes run once for all columns of ``X`` as matrix-matrix
+        products.  Return ``(nabla_b, nabla_w)`` summed over the
+        batch.  They are the network's preallocated buffers and are
+        overwritten by the next call.  ``X`` and ``Y`` are cast to
+        the network's dtype so the buffers can take the results."""
+        X = np.asarray(X, dtype=self.dtype)
+        Y = np.asarray(Y, dtype=self.dtype)
+        activation = X
+        activations = [X]
+        zs = []
+        for b, w in zip(self.biases, self.weights):
+            z = np.dot(w, activation)
+            z += b
+            zs.append(z)
+            activation = sigmoid(z)
+            activations.append(activation)
+        # backward pass, same renumbering of l as in backprop
+        delta = self.cost_derivative(activations[-1], Y) * \
+            sigmoid_prime(zs[-1])
+        for l in range(1, self.num_layers):
+            if l > 1:
+                delta = np.dot(self.weights[-l+1].transpose(), delta) * \
+                    sigmoid_prime(zs[-l])
+            np.sum(delta, axis=1, keepdims=True, out=self.nabla_b[-l])
+            np.dot(delta, activations[-l-1].transpose(),
+                   out=self.nabla_w[-l])
+        return (self.nabla_b, self.nabla_w)
+
+    def as_matrices(self, data):
+        """Return ``data`` as a tuple ``(X, Y)`` with one sample per
+        column of ``X``.  ``data`` is either such a tuple already or a
+        list of ``(x, y)`` tuples as used by ``SGD``.  Vector outputs
+        are stacked into the columns of ``Y``, integer labels (as in
+        test data) into a 1-d array."""
+        if isinstance(data, tuple):
+            X, Y = data
+        else:
+            X = np.hstack([x for x, y in data])
+            Y = [y for x, y in data]
+            Y = np.hstack(Y) if np.ndim(Y[0]) else np.array(Y)
+        X = np.asarray(X, dtype=self.dtype)
+        if np.ndim(Y) == 2:
+            Y = np.asarray(Y, dtype=self.dtype)
+        return X, Y
+
     def evaluate(self, test_data):
         """Return the number of test inputs for which the neural
         network outputs the correct result. Note that the neural
         network's output is assumed to be the index of whichever
-        neuron in the final layer has the highest activation."""
-        test_results = [(np.argmax(self.feedforward(x)), y)
-                        for (x, y) in test_data]
-        return sum(int(x == y) for (x, y) in test_results)
+        neuron in the final layer has the highest activation.  The
+        whole test set goes through the network as one batch."""
+        X, y = self.as_matrices(test_data)
+        return int(np.sum(self.predict(X) == y))
+
+    def save(self, filename, **extra):
+        """Save the layer sizes, weights and biases to the ``.npz``
+        file ``filename``.  Any ``extra`` arrays are stored alongside
+        them under their own names."""
+        arrays = dict(extra)
+        arrays["sizes"] = np.array(self.sizes)
+        for i, (b, w) in enumerate(zip(self.biases, self.weights)):
+            arrays["b{}".format(i)] = b
+            arrays["w{}".format(i)] = w
+        np.savez(filename, **arrays)
 
     def cost_derivative(self, output_activations, y):
         """Return the vector of partial derivatives \partial C_x /
         \partial a for the output activations."""
         return (output_activations-y)
 
+#### Loading a Network
+def load(filename):
+    """Load a network saved with ``Network.save`` from ``filename``.
+    The weights keep the floating point type they were saved with."""
+    with np.load(filename) as data:
+        sizes = [int(s) for s in data["sizes"]]
+        net = Network(sizes, dtype=data["w0"].dtype)
+        net.biases = [data["b{}".format(i)] for i in range(len(sizes)-1)]
+        net.weights = [data["w{}".format(i)] for i in range(len(sizes)-1)]
+    return net
+
 #### Miscellaneous functions
 def sigmoid(z):
     """The sigmoid function."""
@@ -139,4 +264,4 @@ def sigmoid(z):
 def sigmoid_prime(z):
     """Derivative of the sigmoid function."""
     #return sigmoid(z)*(1-sigmoid(z))
-    return 0
\ No newline at end of file
+    return (z > 0).astype(z.dtype)
\ No newline at end of file
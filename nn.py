@@ -6,59 +6,58 @@ import network
 import numpy as np
 import math
 
-random.seed(0)
+#stability label of a sample with i drawn cells, as the original pairwise loop decided it: the neighbour test
+#compares positions in the list of draws (c1 in range(i), c2 in range(i-1)), not the drawn cells, so it only
+#depends on i and needs stable >= i - 1
+def stableLabel(i):
+    c1 = np.arange(i)[:,None]
+    c2 = np.arange(i-1)[None,:]
+    diff = np.abs(c1 - c2)
+    hasNeighbor = (((diff == 1) | ((diff >= 4) & (diff <= 6))) & (c1 != c2)).any(axis=1)
+    stable = int(hasNeighbor.all())
+    return int(stable >= i - 1)
+
+#stream the dataset as chunks (X, Y) with one 25 pixel image per column of X, every chunk holding chunkPerCount
+#samples for each count i of 1..24 drawn cells (less in the last one), so shuffling inside a chunk mixes the counts
+#like shuffling the whole set would; Y holds one-hot label columns, or the labels themselves for test data
+#pixel j is set when one of the i draws from 0..24 is j, pixel 24 is never set
+def datasetChunks(sz, testData=False, chunkPerCount=512, rng=None, dtype=np.float64):
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    counts = np.arange(1, 25)
+    labels = np.array([ stableLabel(i) for i in counts ])
+    for start in range(0, sz, chunkPerCount):
+        c = min(chunkPerCount, sz - start)
+        i = np.repeat(counts, c)
+        coords = rng.integers(0, 25, size=(len(i), 24))
+        drawn = np.arange(24)[None,:] < i[:,None]
+        X = np.zeros((25, len(i)), dtype=dtype)
+        X[coords[drawn], np.nonzero(drawn)[0]] = 1.
+        X[24] = 0.
+        label = np.repeat(labels, c)
+        if testData:
+            yield X, label
+        else:
+            Y = np.zeros((2, len(i)), dtype=dtype)
+            Y[label, np.arange(len(i))] = 1.
+            yield X, Y
 
 #generate 5x5 images of random values and score if they are stable or not based on all nodes inside having neighbors
-def generateDataset(sz, testData=False):
-    dset = []
-    for i in range(1,25):
-        for n in range(sz):
-            coordsTemp = []
-            for j in range(i):
-                #generate i random numbers
-                r = random.randint(0,24)
-                coordsTemp.append(r)
-            stable = 1
-            for c1 in range(len(coordsTemp)):
-                hasNeighbor = False
-                for c2 in range(len(coordsTemp)-1):
-                    if c1 != c2:
-                        diff = abs(c1 - c2)
-                        if diff == 1 or (diff >= 4 and diff <= 6):
-                            hasNeighbor = True
-                if hasNeighbor == False:
-                    stable = 0
-                    break
-            dataTemp = []
-            imageTemp = np.ndarray(shape=(25,1), dtype=np.float64)
-            stableThresh = i - 1
-            for j in range(0,24):
-                if coordsTemp.__contains__(j):
-                    imageTemp[j] = 1.
-                else:
-                    imageTemp[j] = 0.
-            label = []
-            if stable >= stableThresh:
-                if testData:
-                    label = 1
-                else:
-                    label = np.zeros((2,1), dtype=np.float64)
-                    label[1] = 1.
-            else:
-                if testData:
-                    label = 0
-                else:
-                    label = np.zeros((2,1), dtype=np.float64)
-                    label[0] = 1.
-            dset.append((imageTemp,label))
-    
-    return dset
+#returns the whole set as one (X, Y) pair of arrays, sz samples for every count of drawn cells
+def generateDataset(sz, testData=False, rng=None):
+    X, Y = zip(*datasetChunks(sz, testData, rng=rng))
+    return np.hstack(X), np.hstack(Y)
 
-train = generateDataset(10000)
+def main():
+    random.seed(0)
 
-test = generateDataset(2000, True)
+    train = generateDataset(10000)
 
-net = network.Network([25, 10, 2])
+    test = generateDataset(2000, True)
 
-net.SGD(train, 10, 40, 3.0, test)
-    
\ No newline at end of file
+    net = network.Network([25, 10, 2])
+
+    net.SGD(train, 10, 40, 3.0, test)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+import numpy as np
+import hashlib
+import os
+
+class WavefrontOBJ:
+    def __init__( self, default_mtl='default_mtl' ):
+        self.path      = None               # path of loaded object
+        self.mtllibs   = []                 # .mtl files references via mtllib
+        self.mtls      = [ default_mtl ]    # materials referenced
+        self.mtlid     = []                 # indices into self.mtls for each polygon
+        self.vertices  = []                 # vertices as an Nx3 or Nx6 array (per vtx colors)
+        self.normals   = []                 # normals
+        self.texcoords = []                 # texture coordinates
+        self.polygons  = []                 # M*Nv*3 array, Nv=# of vertices, stored as vid,tid,nid (-1 for N/A)
+
+def load_obj( filename: str, default_mtl='default_mtl', triangulate=False ) -> WavefrontOBJ:
+    def parse_vertex( vstr ):
+        vals = vstr.split('/')
+        vid = int(vals[0])-1
+        tid = int(vals[1])-1 if len(vals) > 1 and vals[1] else -1
+        nid = int(vals[2])-1 if len(vals) > 2 else -1
+        return (vid,tid,nid)
+
+    with open( filename, 'r' ) as objf:
+        obj = WavefrontOBJ(default_mtl=default_mtl)
+        obj.path = filename
+        cur_mat = obj.mtls.index(default_mtl)
+        for line in objf:
+            toks = line.split()
+            if not toks:
+                continue
+            if toks[0] == 'v':
+                obj.vertices.append( [ float(v) for v in toks[1:]] )
+            elif toks[0] == 'vn':
+                obj.normals.append( [ float(v) for v in toks[1:]] )
+            elif toks[0] == 'vt':
+                obj.texcoords.append( [ float(v) for v in toks[1:]] )
+            elif toks[0] == 'f':
+                poly = [ parse_vertex(vstr) for vstr in toks[1:] ]
+                if triangulate:
+                    for i in range(2,len(poly)):
+                        obj.mtlid.append( cur_mat )
+                        obj.polygons.append( (poly[0], poly[i-1], poly[i] ) )
+                else:
+                    obj.mtlid.append(cur_mat)
+                    obj.polygons.append( poly )
+            elif toks[0] == 'mtllib':
+                obj.mtllibs.append( toks[1] )
+            elif toks[0] == 'usemtl':
+                if toks[1] not in obj.mtls:
+                    obj.mtls.append(toks[1])
+                cur_mat = obj.mtls.index( toks[1] )
+        return obj
+
+def save_obj( obj: WavefrontOBJ, filename: str ):
+    if not obj.mtlid:
+        obj.mtlid = [-1] * len(obj.polygons)
+    corners = np.array([ v for poly in obj.polygons for v in poly ], dtype=np.int64).reshape(-1,3)
+    faceStart = np.concatenate(([0], np.cumsum([ len(poly) for poly in obj.polygons ]))).astype(np.int64)
+    with open( filename, 'w', buffering=write_buffer ) as ofile:
+        write_obj( ofile, obj.mtllibs, obj.vertices, obj.texcoords, obj.normals, corners, faceStart, obj.mtlid, obj.mtls, '%s' )
+#courtesy of http://jamesgregson.ca/loadsave-wavefront-obj-files-in-python.html
+
+# default location of the parsed mesh cache used by load_obj_arrays
+cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'objcache')
+
+class ObjArrays:
+    def __init__( self, default_mtl='default_mtl' ):
+        self.path      = None                                   # path of loaded object
+        self.mtllibs   = []                                     # .mtl files references via mtllib
+        self.mtls      = [ default_mtl ]                        # materials referenced
+        self.mtlid     = np.zeros(0, dtype=np.int32)            # indices into self.mtls for each polygon
+        self.vertices  = np.zeros((0,3), dtype=np.float32)      # vertices as an Nx3 or Nx6 array (per vtx colors)
+        self.normals   = np.zeros((0,3), dtype=np.float32)      # normals
+        self.texcoords = np.zeros((0,2), dtype=np.float32)      # texture coordinates
+        self.corners   = np.zeros((0,3), dtype=np.int32)        # polygon corners of all polygons back to back, stored as vid,tid,nid (-1 for N/A)
+        self.faceStart = np.zeros(1, dtype=np.int64)            # polygon i is corners[faceStart[i]:faceStart[i+1]]
+        self.triangulated = False                               # polygons were split into triangles while loading
+
+    def __len__( self ):
+        return len(self.faceStart) - 1
+
+    def polygon( self, i ):
+        return self.corners[self.faceStart[i]:self.faceStart[i+1]]
+
+    # M*Nv*3 array when every polygon has the same number of vertices, None otherwise
+    @property
+    def faces( self ):
+        sides = np.diff(self.faceStart)
+        if len(sides) == 0 or np.any(sides != sides[0]):
+            return None
+        return self.corners.reshape(len(sides), int(sides[0]), 3)
+
+    # vertex ids of every polygon split into a triangle fan, as a T*3 array
+    def triangles( self ):
+        return fan_corners(self.corners, self.faceStart)[0][:,0].reshape(-1,3)
+
+    # the same mesh as a WavefrontOBJ of python lists for code written against load_obj
+    def wavefront( self ):
+        obj = WavefrontOBJ(default_mtl=self.mtls[0])
+        obj.path      = self.path
+        obj.mtllibs   = list(self.mtllibs)
+        obj.mtls      = list(self.mtls)
+        obj.mtlid     = self.mtlid.tolist()
+        obj.vertices  = self.vertices.tolist()
+        obj.normals   = self.normals.tolist()
+        obj.texcoords = self.texcoords.tolist()
+        corners = [ tuple(c) for c in self.corners.tolist() ]
+        obj.polygons = [ corners[a:b] for a, b in zip(self.faceStart[:-1].tolist(), self.faceStart[1:].tolist()) ]
+        if self.triangulated:
+            obj.polygons = [ tuple(p) for p in obj.polygons ]
+        return obj
+
+# split polygons into triangle fans (poly[0], poly[i-1], poly[i]) in the same order load_obj(triangulate=True) uses,
+# returns the triangle corners and the polygon each triangle came from
+def fan_corners( corners, faceStart ):
+    ntri = np.maximum(np.diff(faceStart) - 2, 0)
+    src = np.repeat(np.arange(len(ntri)), ntri)
+    i = np.arange(int(ntri.sum())) - np.repeat(np.cumsum(ntri) - ntri, ntri) + 2
+    base = faceStart[:-1][src]
+    tris = np.stack((corners[base], corners[base+i-1], corners[base+i]), axis=1)
+    return tris.reshape(-1,3), src
+
+# bumped whenever the parser changes what it produces so stale .npz caches get parsed again
+cache_version = 2
+
+# bytes of the file handled at once by the bulk parser, blocks always end on a line break
+block_bytes = 1 << 26
+
+# parse polygon corner tokens like "v", "v/t", "v//n" or "v/t/n" into vid,tid,nid rows
+def parse_corners( text, count ):
+    ret = np.full((count,3), -1, dtype=np.int32)
+    if count == 0:
+        return ret
+    data = np.frombuffer(text, dtype=np.uint8)
+    gap = (data == 32) | (data == 10)
+    first = ~gap
+    first[1:] &= gap[:-1]
+    token = np.cumsum(first) - 1     # token of every byte, every token needs the same number of slashes
+    per_token = np.bincount(token[data == 47], minlength=count)
+    slashes = int(per_token[0])
+    if len(per_token) != count or np.any(per_token != slashes) or b'/ ' in text or b'/\n' in text or text.endswith(b'/'):
+        cols = [ (int(v[0]), int(v[1]) if len(v) > 1 and v[1] else 0, int(v[2]) if len(v) > 2 else 0)
+                 for v in (t.split(b'/') for t in text.split()) ]
+        vals = np.array(cols, dtype=np.int64)
+    else:
+        vals = np.fromstring(text.replace(b'//',b'/0/').replace(b'/',b' '), dtype=np.int64, sep=' ').reshape(count, slashes+1)
+    ret[:,:vals.shape[1]] = vals - 1    # a missing index is stored as 0 and so becomes -1
+    return ret
+
+# parse one block of complete lines, every line is classified by its first bytes and the
+# values of each kind of line are cut out of the block and converted in one call
+def parse_block( buf ):
+    buf = buf.rstrip(b'\r\n')
+    if not buf:
+        return { 'vertices': None, 'normals': None, 'texcoords': None, 'sides': np.zeros(0, dtype=np.int64),
+                 'corners': np.zeros((0,3), dtype=np.int32), 'special': [] }
+    data = np.frombuffer(buf, dtype=np.uint8).copy()
+    data[(data == 9) | (data == 13)] = 32
+    newline = data == 10
+    starts = np.concatenate(([0], np.flatnonzero(newline)+1))
+    if np.any(data[starts[starts < len(data)]] == 32):
+        buf = b'\n'.join( l.lstrip() for l in data.tobytes().split(b'\n') )
+        return parse_block( buf )
+    lengths = np.diff(np.append(starts, len(data)))      # bytes of every line including its line break
+    filled = (data != 32) & ~newline
+    first = filled.copy()
+    first[1:] &= ~filled[:-1]
+    tokens = np.add.reduceat(first, starts, dtype=np.int64)
+    head = np.zeros((len(starts), 7), dtype=np.uint8)
+    idx = starts[:,None] + np.arange(7)
+    inside = idx < len(data)
+    head[inside] = data[idx[inside]]
+    def lines_of( tag ):
+        return np.all(head[:,:len(tag)] == np.frombuffer(tag, dtype=np.uint8), axis=1)
+    def values_of( sel, skip ):
+        mask = np.repeat(sel, lengths)
+        for k in range(skip):
+            mask[starts[sel] + k] = False
+        return data[mask].tobytes()
+    ret = {}
+    for tag, name in ( (b'v ', 'vertices'), (b'vn ', 'normals'), (b'vt ', 'texcoords') ):
+        sel = lines_of(tag)
+        cols = np.unique(tokens[sel] - 1)
+        if len(cols) > 1:
+            raise ValueError('{} rows have different numbers of values'.format(tag.decode().strip()))
+        if len(cols) == 0:
+            ret[name] = None
+            continue
+        ret[name] = np.fromstring(values_of(sel, len(tag)), dtype=np.float64, sep=' ').reshape(-1, int(cols[0]))
+    sel = lines_of(b'f ')
+    ret['sides'] = tokens[sel] - 1
+    ret['corners'] = parse_corners(values_of(sel, 2), int(ret['sides'].sum()))
+    faces_before = np.cumsum(sel) - sel
+    ret['special'] = []
+    for i in np.flatnonzero(lines_of(b'usemtl ') | lines_of(b'mtllib ')):
+        toks = bytes(data[starts[i]:starts[i+1] if i+1 < len(starts) else len(data)]).decode('utf-8').split()
+        ret['special'].append( (int(faces_before[i]), toks[0], toks[1]) )
+    return ret
+
+def read_blocks( filename ):
+    with open( filename, 'rb' ) as objf:
+        rest = b''
+        while True:
+            buf = objf.read(block_bytes)
+            if not buf:
+                break
+            buf = rest + buf
+            cut = buf.rfind(b'\n')
+            if cut < 0:
+                rest = buf
+                continue
+            rest = buf[cut+1:]
+            yield buf[:cut]
+        if rest:
+            yield rest
+
+def parse_obj_arrays( filename, default_mtl, triangulate ):
+    obj = ObjArrays(default_mtl=default_mtl)
+    obj.path = filename
+    parts = { 'vertices': [], 'normals': [], 'texcoords': [], 'sides': [], 'corners': [] }
+    mtl_index = { default_mtl: 0 }
+    runs = []       # (first polygon, material) for every usemtl
+    nfaces = 0
+    for buf in read_blocks( filename ):
+        block = parse_block( buf )
+        for name in parts:
+            if block[name] is not None:
+                parts[name].append( block[name] )
+        for face, tag, value in block['special']:
+            if tag == 'mtllib':
+                obj.mtllibs.append( value )
+            else:
+                if value not in mtl_index:
+                    mtl_index[value] = len(obj.mtls)
+                    obj.mtls.append(value)
+                runs.append( (nfaces + face, mtl_index[value]) )
+        nfaces += len(block['sides'])
+    for name, cols in ( ('vertices', 3), ('normals', 3), ('texcoords', 2) ):
+        if parts[name]:
+            if len(set( p.shape[1] for p in parts[name] )) > 1:
+                raise ValueError('{} have different numbers of values'.format(name))
+            setattr(obj, name, np.concatenate(parts[name]).astype(np.float32))
+    sides = np.concatenate(parts['sides']) if parts['sides'] else np.zeros(0, dtype=np.int64)
+    obj.faceStart = np.concatenate(([0], np.cumsum(sides))).astype(np.int64)
+    if parts['corners']:
+        obj.corners = np.concatenate(parts['corners'])
+    if runs:
+        starts = np.array([ r[0] for r in runs ])
+        ids = np.array([ r[1] for r in runs ], dtype=np.int32)
+        run = np.searchsorted(starts, np.arange(len(sides)), side='right') - 1
+        obj.mtlid = np.where(run >= 0, ids[np.maximum(run,0)], mtl_index[default_mtl]).astype(np.int32)
+    else:
+        obj.mtlid = np.zeros(len(sides), dtype=np.int32)
+    if triangulate:
+        obj.corners, src = fan_corners(obj.corners, obj.faceStart)
+        obj.mtlid = obj.mtlid[src]
+        obj.faceStart = np.arange(0, len(obj.corners)+1, 3, dtype=np.int64)
+        obj.triangulated = True
+    return obj
+
+def cache_file( filename, directory ):
+    name = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+    return os.path.join(directory, name+'.npz')
+
+# load an obj file into contiguous arrays, float32 vertices/normals/texcoords and int32 corners with per-polygon material ids
+# parsed meshes are kept in an uncompressed .npz cache keyed by path, size and mtime so repeat loads skip parsing
+def load_obj_arrays( filename: str, default_mtl='default_mtl', triangulate=False, cache=True, directory=None ) -> ObjArrays:
+    st = os.stat(filename)
+    key = '{}|{}|{}|{}|{}|{}'.format(cache_version, os.path.abspath(filename), st.st_size, st.st_mtime_ns, triangulate, default_mtl)
+    path = cache_file(filename, directory or cache_dir)
+    if cache and os.path.exists(path):
+        with np.load(path) as data:
+            if str(data['key']) == key:
+                obj = ObjArrays(default_mtl=default_mtl)
+                obj.path = filename
+                obj.triangulated = triangulate
+                obj.mtllibs = data['mtllibs'].tolist()
+                obj.mtls = data['mtls'].tolist()
+                for name in ( 'mtlid', 'vertices', 'normals', 'texcoords', 'corners', 'faceStart' ):
+                    setattr(obj, name, data[name])
+                return obj
+    obj = parse_obj_arrays( filename, default_mtl, triangulate )
+    if cache:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path+'.{}.tmp'.format(os.getpid())
+        with open( tmp, 'wb' ) as cf:
+            np.savez(cf, key=np.array(key), mtllibs=np.array(obj.mtllibs, dtype=str), mtls=np.array(obj.mtls, dtype=str),
+                     mtlid=obj.mtlid, vertices=obj.vertices, normals=obj.normals, texcoords=obj.texcoords,
+                     corners=obj.corners, faceStart=obj.faceStart)
+        os.replace(tmp, path)
+    return obj
+
+# rows formatted per write and size of the file buffer used by the writers
+write_rows_per_chunk = 1 << 16
+write_buffer = 1 << 20
+
+# write one line per row as prefix followed by the values, a chunk of rows at a time with one % formatting call
+def write_rows( ofile, prefix, rows, fmt ):
+    for k in range(0, len(rows), write_rows_per_chunk):
+        chunk = rows[k:k+write_rows_per_chunk]
+        if isinstance(chunk, np.ndarray):
+            chunk = chunk.tolist()
+        width = len(chunk[0])
+        if all( len(r) == width for r in chunk ):
+            line = prefix + ' '.join([fmt] * width) + '\n'
+            ofile.write( (line * len(chunk)) % tuple( v for r in chunk for v in r ) )
+        else:
+            ofile.write( ''.join( prefix + ' '.join( fmt % v for v in r ) + '\n' for r in chunk ) )
+
+# corner formats by which of tid (1) and nid (2) are present, as save_obj has always written them
+corner_formats = [ '{0}/ ', '{0}/{1} ', '{0}//{2} ', '{0}/{1}/{2} ' ]
+plain_corner_formats = [ '{0} ', '{0}/{1} ', '{0}//{2} ', '{0}/{1}/{2} ' ]
+
+# write polygons pids (corners[faceStart[i]:faceStart[i+1]] each) as f lines
+def write_faces( ofile, corners, faceStart, pids, formats=corner_formats ):
+    for k in range(0, len(pids), write_rows_per_chunk):
+        chunk = pids[k:k+write_rows_per_chunk]
+        sides = faceStart[chunk+1] - faceStart[chunk]
+        idx = np.repeat(faceStart[chunk], sides) + np.arange(int(sides.sum())) - np.repeat(np.cumsum(sides) - sides, sides)
+        c = corners[idx]
+        case = (c[:,1] >= 0) + 2 * (c[:,2] >= 0)
+        vals = c + 1
+        if len(c) and np.all(sides == sides[0]) and np.all(case == case[0]):
+            cols = [0] + ([1] if case[0] & 1 else []) + ([2] if case[0] & 2 else [])
+            fmt = formats[case[0]].replace('{0}','%d').replace('{1}','%d').replace('{2}','%d')
+            line = 'f ' + fmt * int(sides[0]) + '\n'
+            ofile.write( (line * len(chunk)) % tuple(vals[:,cols].ravel().tolist()) )
+        else:
+            parts = [ formats[t].format(*v) for t, v in zip(case.tolist(), vals.tolist()) ]
+            ends = np.cumsum(sides).tolist()
+            starts = [0] + ends[:-1]
+            ofile.write( ''.join( 'f ' + ''.join(parts[a:b]) + '\n' for a, b in zip(starts, ends) ) )
+
+# streaming writer shared by save_obj and save_obj_arrays, polygons are grouped by material
+# in np.argsort order of mtlid and a usemtl line starts every group, except a leading group of -1
+def write_obj( ofile, mtllibs, vertices, texcoords, normals, corners, faceStart, mtlid, mtls, fmt ):
+    for mlib in mtllibs:
+        ofile.write('mtllib {}\n'.format(mlib))
+    write_rows( ofile, 'v ', vertices, fmt )
+    write_rows( ofile, 'vt ', texcoords, fmt )
+    write_rows( ofile, 'vn ', normals, fmt )
+    mtlid = np.asarray( mtlid, dtype=np.int64 )
+    poly_idx = np.argsort( mtlid )
+    if len(poly_idx) == 0:
+        return
+    sorted_ids = mtlid[poly_idx]
+    bounds = np.flatnonzero(np.diff(sorted_ids)) + 1
+    for a, b in zip( np.concatenate(([0], bounds)).tolist(), np.concatenate((bounds, [len(poly_idx)])).tolist() ):
+        if sorted_ids[a] != -1 or a > 0:
+            ofile.write('usemtl {}\n'.format(mtls[sorted_ids[a]]))
+        write_faces( ofile, corners, faceStart, poly_idx[a:b] )
+
+# save an ObjArrays mesh, floats are written with fmt (9 significant digits round-trip float32)
+def save_obj_arrays( obj: ObjArrays, filename: str, fmt='%.9g' ):
+    mtlid = obj.mtlid if len(obj.mtlid) else np.full(len(obj), -1)
+    with open( filename, 'w', buffering=write_buffer ) as ofile:
+        write_obj( ofile, obj.mtllibs, obj.vertices, obj.texcoords, obj.normals, obj.corners, obj.faceStart, mtlid, obj.mtls, fmt )
+
+# exposed quad faces of a voxel volume indexed [z][x][y], as lattice corner ids (F,4) ordered counter-clockwise seen
+# from outside, the volume is read one slab of layers at a time so any volume kind works
+def voxel_faces( vol, slab=32 ):
+    Z, X, Y = vol.shape
+    dims = (Z+1, X+1, Y+1)
+    quads = []
+    # unit square in the two axes (b,c) following the face axis a cyclically, wound so its normal is +a
+    square = np.array([ [0,0], [1,0], [1,1], [0,1] ])
+    for z0 in range(0, Z, slab):
+        z1 = min(z0 + slab, Z)
+        lo, hi = max(z0-1, 0), min(z1+1, Z)
+        block = np.zeros((z1-z0+2, X+2, Y+2), dtype=bool)
+        block[lo-z0+1:hi-z0+1, 1:X+1, 1:Y+1] = (np.asarray(vol[lo:hi]) == 1)
+        inner = block[1:-1, 1:-1, 1:-1]
+        for axis in range(3):
+            for side in ( -1, 1 ):
+                shift = [ slice(1,-1) ] * 3
+                shift[axis] = slice(1+side, block.shape[axis]-1+side)
+                exposed = np.nonzero(inner & ~block[tuple(shift)])
+                if len(exposed[0]) == 0:
+                    continue
+                pos = np.stack(exposed, axis=1)
+                pos[:,0] += z0
+                # volume axes 0,1,2 are obj z,x,y, and the cyclic partners of obj x are y,z, of y are z,x, of z are x,y
+                b, c = { 1: (2, 0), 2: (0, 1), 0: (1, 2) }[axis]
+                corners = np.repeat(pos[:,None,:], 4, axis=1)
+                corners[:,:,axis] += (side > 0)
+                sq = square if side > 0 else square[::-1]
+                corners[:,:,b] += sq[:,0]
+                corners[:,:,c] += sq[:,1]
+                quads.append( np.ravel_multi_index(tuple(np.moveaxis(corners, 2, 0)), dims) )
+    if not quads:
+        return np.zeros((0,4), dtype=np.int64), dims
+    return np.concatenate(quads), dims
+
+# write the surface of a voxel volume as an obj of quads, only faces between a filled voxel and an
+# empty one (or the outside) are written and vertices are shared between neighbouring faces
+# voxel [z][x][y] spans x..x+1, y..y+1, z..z+1 scaled by scale and shifted by origin
+def save_voxels( vol, filename: str, scale=1.0, origin=(0.,0.,0.), fmt='%.9g' ):
+    quads, dims = voxel_faces( vol )
+    ids, quads = np.unique(quads, return_inverse=True)
+    quads = quads.reshape(-1,4)
+    z, x, y = np.unravel_index(ids, dims)
+    verts = np.stack((x, y, z), axis=1) * scale + np.asarray(origin)
+    corners = np.full((quads.size, 3), -1, dtype=np.int64)
+    corners[:,0] = quads.ravel()
+    faceStart = np.arange(0, quads.size+1, 4, dtype=np.int64)
+    with open( filename, 'w', buffering=write_buffer ) as ofile:
+        write_rows( ofile, 'v ', verts, fmt )
+        write_faces( ofile, corners, faceStart, np.arange(len(quads)), plain_corner_formats )
@@ -0,0 +1,143 @@
+import numpy as np
+import instrument
+import strength
+import surrogate
+
+#scan order (x then y) position of the last flaw in a layer's flaw mask
+def lastFlaw(mask):
+    flat = mask.reshape(-1)
+    return len(flat) - 1 - int(np.argmax(flat[::-1]))
+
+#a printed layer: every voxel lands as 1, except that the flaw at position f (scan order) had the layer
+#reprinted from obj to test the strength, so positions up to f keep obj's values and f is patched if fixed
+def printedLayer(objLayer, mask, fix):
+    layer = np.ones(mask.shape, dtype=np.int8)
+    if mask.any():
+        f = lastFlaw(mask)
+        layer.reshape(-1)[:f+1] = np.asarray(objLayer).reshape(-1)[:f+1]
+        if fix:
+            layer.reshape(-1)[f] = 1
+    return layer
+
+#print obj like checker.buildObject, drawing each layer's flaw mask in one call instead of one voxel at a time
+#a flaw shifts its voxel one step along y and the rest of the object is reprinted from obj before testing,
+#so every flaw of layer z sees the same object (printed layers below z, obj above) and one strength check
+#per flawed layer covers all of them, finished layers are only rescored when the next check needs them
+#returns (cost, flaws, corrected), out receives the printed inner voxels when given
+#with sur, a trained StrSurrogate, blocks the cache has not seen are estimated and only scored exactly when a
+#decision is too close to call (surrogate.ScreenedStr)
+#each flawed layer is reported to the current instrument as a "layer" event
+def simulateBuild(obj, size, rng=None, flawRate=.01, correctionCost=7, strThresh=5, cache="default", out=None, sur=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    ins = instrument.current
+    with ins.phase("strength"):
+        if sur is None:
+            tracker = strength.IncrementalStr(obj, size, cache)
+        else:
+            tracker = surrogate.ScreenedStr(sur, obj, size, cache)
+    amtFlaws = 0
+    corrected = 0
+    pending = []                    # printed layers not yet handed to the tracker
+    for z in range(1, size+1):
+        with ins.phase("deposition"):
+            mask = rng.random((size, size)) < flawRate
+            flaws = int(np.count_nonzero(mask))
+        fix = False
+        if flaws:
+            with ins.phase("strength"):
+                if pending:
+                    tracker.setLayers(z - len(pending), np.stack(pending))
+                    pending = []
+                loss, exact = tracker.loss(strThresh)
+            fix = 0 < loss < strThresh
+            amtFlaws += flaws
+            ins.count("strengthCalls")
+            ins.count("flaws", flaws)
+            ins.event("layer", z=z, flaws=flaws, str=int(tracker.total), strOld=int(tracker.refTotal), exact=exact,
+                      corrected=flaws if fix else 0)
+            if fix:
+                with ins.phase("correction"):
+                    corrected += flaws
+                    ins.count("corrections", flaws)
+        with ins.phase("deposition"):
+            layer = printedLayer(obj[z, 1:size+1, 1:size+1], mask, fix)
+            pending.append(layer)
+            if out is not None:
+                out[z, 1:size+1, 1:size+1] = layer
+        if len(pending) == 5:       # one block row, keeps the buffer small when flaws are rare
+            with ins.phase("strength"):
+                tracker.setLayers(z - 4, np.stack(pending))
+            pending = []
+    cost = size*size*size + correctionCost*corrected
+    return cost, amtFlaws, corrected
+
+#one record per printed layer from streamBuild: its cost, flaws and corrections, the strength lost against obj
+#at its strength check (0 without flaws) and the strength of the block rows finished so far
+layerDtype = np.dtype([('z', np.int64), ('cost', np.int64), ('flaws', np.int64), ('corrected', np.int64),
+                       ('strLoss', np.int64), ('printedStr', np.int64)])
+
+#simulateBuild over a stream of obj layers 0..size+1 (an iterable like infill.infillLayers or a volume), yielding
+#a layerDtype tuple per printed layer. a flaw sees printed layers below it and obj above, so against obj only its
+#block row differs from the rows already finished, whose loss is kept as a running sum; only the obj and printed
+#layers of the current block row are held, memory stays the same whatever the part height
+#the rng draws, flaws and corrections match simulateBuild
+def streamBuild(layers, size, rng=None, flawRate=.01, correctionCost=7, strThresh=5, cache="default"):
+    if rng is None:
+        rng = np.random.default_rng()
+    ins = instrument.current
+    layers = iter(layers)
+    with ins.phase("generation"):
+        next(layers)                # layer 0 is padding
+    n = strength.blockCount(size)
+    m = strength.reducedExtent(n)
+    e = 5*n - 2                     # layers past e are not part of any block
+    lost = 0                        # strength lost in the finished block rows
+    printedStr = 0
+    rowObj = rowPrinted = refRow = None
+    for z in range(1, size+1):
+        k = (z + 1) // 5 if z <= e else None
+        if k is not None and (z == 1 or z == 5*k - 1):
+            #block row k covers layers 5k-1..5k+3, the first row starts with two layers of zero padding
+            rowObj = [ np.zeros((size, size), dtype=np.int8) ] * 2 if k == 0 else []
+            rowPrinted = rowObj[:]
+            with ins.phase("generation"):
+                while len(rowObj) < 5:
+                    rowObj.append(np.asarray(next(layers))[1:size+1, 1:size+1])
+            with ins.phase("strength"):
+                refRow = strength.rowStr([ l[:e, :e] for l in rowObj ], n, cache)
+        if k is not None:
+            objLayer = rowObj[len(rowPrinted)]
+        else:
+            with ins.phase("generation"):
+                objLayer = np.asarray(next(layers))[1:size+1, 1:size+1]
+        with ins.phase("deposition"):
+            mask = rng.random((size, size)) < flawRate
+            flaws = int(np.count_nonzero(mask))
+        fix = False
+        loss = 0
+        if flaws:
+            loss = lost
+            if k is not None and k < m:
+                with ins.phase("strength"):
+                    mixed = strength.rowStr([ l[:e, :e] for l in rowPrinted + rowObj[len(rowPrinted):] ], n, cache)
+                loss += int(np.sum((refRow - mixed)[:m, :m]))
+            fix = 0 < loss < strThresh
+            ins.count("strengthCalls")
+            ins.count("flaws", flaws)
+            ins.event("layer", z=z, flaws=flaws, strLoss=loss, corrected=flaws if fix else 0)
+            if fix:
+                ins.count("corrections", flaws)
+        with ins.phase("deposition"):
+            layer = printedLayer(objLayer, mask, fix)
+        if k is not None:
+            rowPrinted.append(layer)
+            if len(rowPrinted) == 5:
+                if k < m:
+                    with ins.phase("strength"):
+                        final = strength.rowStr([ l[:e, :e] for l in rowPrinted ], n, cache)
+                    lost += int(np.sum((refRow - final)[:m, :m]))
+                    printedStr += int(np.sum(final[:m, :m]))
+                rowObj = rowPrinted = refRow = None
+        corrected = flaws if fix else 0
+        yield (z, size*size + correctionCost*corrected, flaws, corrected, loss, printedStr)
@@ -0,0 +1,396 @@
+import numpy as np
+import collections
+import multiprocessing
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+#neighbours are weighted by how many planes they share with the voxel: 16 for faces (and the voxel itself), 4 for edges, 1 for corners
+def neighborKernel():
+    kernel = np.zeros((3,3,3), dtype=np.int16)
+    for z1 in range(-1,2):
+        for x1 in range(-1,2):
+            for y1 in range(-1,2):
+                planesInCommon = (z1 == 0) + (x1 == 0) + (y1 == 0)
+                if planesInCommon == 0:
+                    kernel[z1+1][x1+1][y1+1] = 1
+                elif planesInCommon == 1:
+                    kernel[z1+1][x1+1][y1+1] = 4
+                else:
+                    kernel[z1+1][x1+1][y1+1] = 16
+    return kernel
+
+kernel = neighborKernel()
+
+#voxels handled per batch when scoring a volume, keeps the temporaries bounded for large parts
+batchVoxels = 1 << 22
+
+#per voxel neighbour score of a stack of 5x5x5 blocks shaped (...,5,5,5)
+#matches getStr5by5 at the block faces: a -1 index wraps to 4 (python negative indexing) and a 5 is skipped (IndexError)
+def voxelStr5by5(blocks):
+    filled = (np.asarray(blocks) == 1)
+    lead = filled.shape[:-3]
+    padded = np.zeros(lead + (7,7,7), dtype=np.int16)
+    padded[...,1:6,1:6,1:6] = filled
+    padded[...,0,:,:] = padded[...,5,:,:]
+    padded[...,:,0,:] = padded[...,:,5,:]
+    padded[...,:,:,0] = padded[...,:,:,5]
+    acc = np.zeros(lead + (5,5,5), dtype=np.int16)
+    for z1 in range(3):
+        for x1 in range(3):
+            for y1 in range(3):
+                acc += kernel[z1,x1,y1] * padded[...,z1:z1+5,x1:x1+5,y1:y1+5]
+    acc *= filled
+    return acc
+
+#strength of every 5x5x5 block in a stack shaped (...,5,5,5), same values as getStr5by5 per block
+def str5by5Batch(blocks):
+    return voxelStr5by5(blocks).sum(axis=(-3,-2,-1), dtype=np.int64)
+
+#memo of block strengths keyed on the 125 block bits packed into 16 bytes, infill is periodic so most
+#blocks of a volume repeat within it and across evaluations; least recently used entries are evicted
+#past maxEntries and a table saved with save() is loaded again when the cache is created with the same path
+class BlockStrCache:
+    def __init__( self, maxEntries=1 << 18, path=None ):
+        self.maxEntries = maxEntries
+        self.path       = path
+        self.table      = collections.OrderedDict()     # packed block bits -> strength
+        self.hits       = 0
+        self.misses     = 0
+        self.evictions  = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__( self ):
+        return len(self.table)
+
+    #strengths of a stack of blocks shaped (...,5,5,5), only blocks never seen before are scored
+    def lookup( self, blocks ):
+        blocks = np.asarray(blocks)
+        lead = blocks.shape[:-3]
+        flat = (blocks == 1).reshape(-1, 125)
+        if len(flat) == 0:
+            return np.zeros(lead, dtype=np.int64)
+        keys = np.ascontiguousarray(np.packbits(flat, axis=1)).view('V16').ravel()
+        uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        vals = np.empty(len(uniq), dtype=np.int64)
+        missing = []
+        for i, key in enumerate(uniq.tolist()):
+            val = self.table.get(key)
+            if val is None:
+                missing.append(i)
+            else:
+                self.table.move_to_end(key)
+                vals[i] = val
+        if missing:
+            missing = np.array(missing)
+            vals[missing] = str5by5Batch(flat[first[missing]].reshape(-1,5,5,5))
+            for i in missing.tolist():
+                self.table[uniq[i].tobytes()] = int(vals[i])
+            while len(self.table) > self.maxEntries:
+                self.table.popitem(last=False)
+                self.evictions += 1
+        self.misses += len(missing)
+        self.hits += len(flat) - len(missing)
+        return vals[inverse.ravel()].reshape(lead)
+
+    #strengths of the blocks already in the table and which ones they are, (vals, found) shaped like the stack,
+    #blocks never seen are left unscored
+    def peek( self, blocks ):
+        blocks = np.asarray(blocks)
+        lead = blocks.shape[:-3]
+        flat = (blocks == 1).reshape(-1, 125)
+        vals = np.zeros(len(flat), dtype=np.int64)
+        found = np.zeros(len(flat), dtype=bool)
+        if len(flat):
+            keys = np.ascontiguousarray(np.packbits(flat, axis=1)).view('V16').ravel()
+            for i, key in enumerate(keys.tolist()):
+                val = self.table.get(key)
+                if val is not None:
+                    vals[i] = val
+                    found[i] = True
+            self.hits += int(found.sum())
+        return vals.reshape(lead), found.reshape(lead)
+
+    def stats( self ):
+        total = self.hits + self.misses
+        return { 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                 'entries': len(self.table), 'hitRate': self.hits / total if total else 0.0 }
+
+    def resetStats( self ):
+        self.hits = self.misses = self.evictions = 0
+
+    def save( self, path=None ):
+        path = path or self.path
+        keys = np.frombuffer(b''.join(self.table.keys()), dtype=np.uint8).reshape(-1, 16)
+        vals = np.fromiter(self.table.values(), dtype=np.int64, count=len(self.table))
+        tmp = path + '.{}.tmp'.format(os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez(f, keys=keys, vals=vals)
+        os.replace(tmp, path)
+
+    def load( self, path ):
+        with np.load(path) as data:
+            for key, val in zip(data['keys'], data['vals'].tolist()):
+                self.table[key.tobytes()] = val
+        while len(self.table) > self.maxEntries:
+            self.table.popitem(last=False)
+
+#cache used when none is passed explicitly, set to None to always score every block
+blockCache = BlockStrCache()
+
+#scores a stack of blocks through the given cache, the module cache when it is "default"
+def scoreBlocks(blocks, cache="default"):
+    if cache == "default":
+        cache = blockCache
+    if cache is None:
+        return str5by5Batch(blocks)
+    return cache.lookup(blocks)
+
+#the strengths the given cache already knows for a stack of blocks without scoring the others, (vals, found)
+def knownBlocks(blocks, cache="default"):
+    if cache == "default":
+        cache = blockCache
+    if cache is None:
+        lead = np.shape(blocks)[:-3]
+        return np.zeros(lead, dtype=np.int64), np.zeros(lead, dtype=bool)
+    return cache.peek(blocks)
+
+#number of 5x5x5 blocks along each axis getObjStr scores for a given size
+def blockCount(size):
+    return int(size / 5)
+
+#blocks for block rows k0..k1 (along z) as an array shaped (k1-k0,n,n,5,5,5)
+#block k is centered on inner index 5k like get5by5, so it covers 5k-2..5k+2 and the low side is zero padded
+def extractBlocks(obj, size, k0, k1):
+    n = blockCount(size)
+    zLo = max(5*k0 - 2, 0)
+    zHi = 5*k1 - 2
+    slab = np.zeros((5*(k1-k0), 5*n, 5*n), dtype=np.int8)
+    if zHi > zLo:
+        inner = np.asarray(obj[1+zLo:1+zHi, 1:5*n-1, 1:5*n-1])
+        slab[zLo - (5*k0 - 2):, 2:, 2:] = (inner == 1)
+    slab = slab.reshape(k1-k0, 5, n, 5, n, 5)
+    return slab.transpose(0,2,4,1,3,5)
+
+#strengths of the (n,n) blocks of one block row from its five layers of inner voxels, (5, 5n-2, 5n-2) clipped like
+#extractBlocks with the layers below index 0 given as zeros
+def rowStr(layers, n, cache="default"):
+    slab = np.zeros((5, 5*n, 5*n), dtype=np.int8)
+    slab[:, 2:, 2:] = (np.asarray(layers) == 1)
+    return scoreBlocks(slab.reshape(5, n, 5, n, 5).transpose(1, 3, 0, 2, 4), cache)
+
+#first level of getObjStr: the (n,n,n) grid of 5x5x5 block strengths
+def blockStrGrid(obj, size, cache="default"):
+    n = blockCount(size)
+    grid = np.zeros((n,n,n), dtype=int)
+    if n == 0:
+        return grid
+    step = max(1, batchVoxels // (125*n*n))
+    for k0 in range(0, n, step):
+        k1 = min(n, k0 + step)
+        grid[k0:k1] = scoreBlocks(extractBlocks(obj, size, k0, k1), cache)
+    return grid
+
+#extent of the block grid covered by the second level of getObjStr
+def reducedExtent(n):
+    n2 = int(n / 5)
+    if n2 == 0:
+        return 0
+    return 5*n2 - 2
+
+#second level of getObjStr: sum the 5x5x5 neighbourhoods of the grid centered on multiples of 5
+def reduceStr(grid):
+    m = reducedExtent(len(grid))
+    return np.sum(grid[:m,:m,:m])
+
+#get the strength of a full object in one batched pass
+def objStr(obj, size, cache="default"):
+    return reduceStr(blockStrGrid(obj, size, cache))
+
+#keeps the block strength grid of a volume so a change only rescores the 5x5x5 blocks it touches
+#starts from the reference object, refTotal stays its strength while total follows the updated volume
+#the scored voxels are kept only for the keepRows block rows changed last, any other row is read again a
+#block row at a time, from obj while it is unchanged, so memory stays a few block rows whatever the part size
+class IncrementalStr:
+    keepRows = 3
+
+    def __init__( self, obj, size, cache="default" ):
+        self.obj      = obj                                         # reference volume, read back for unchanged rows
+        self.size     = size
+        self.cache    = cache
+        self.n        = blockCount(size)
+        self.m        = reducedExtent(self.n)
+        self.e        = 5*self.n - 2                                # inner layers covered by the blocks
+        self.grid     = self.initialGrid(obj)
+        self.refTotal = reduceStr(self.grid)
+        self.total    = self.refTotal
+        self.rows     = collections.OrderedDict()                   # block row -> its scored voxels, (5,5n,5n) int8
+        self.changed  = set()                                       # block rows that may differ from obj
+        self.dirtyFrom = 1                                          # first layer that may differ from the scored rows
+
+    #block strength grid of the reference volume
+    def initialGrid(self, obj):
+        return blockStrGrid(obj, self.size, self.cache)
+
+    #strengths of the changed blocks (bx, by) of row k, blocks shaped (len(bx),5,5,5)
+    def scoreChanged(self, k, bx, by, blocks):
+        return scoreBlocks(blocks, self.cache)
+
+    #called when block row k is no longer kept
+    def dropRow(self, k):
+        pass
+
+    #strength lost against the reference volume, refTotal - total, for a decision 0 < loss < strThresh
+    #returns (loss, whether it is exact)
+    def loss(self, strThresh):
+        return self.refTotal - self.total, True
+
+    #voxels of block row k read from a volume, in block coordinates (inner index + 2) like extractBlocks
+    def rowVoxels(self, obj, k):
+        slab = np.zeros((5, 5*self.n, 5*self.n), dtype=np.int8)
+        zLo = max(5*k - 2, 0)
+        slab[zLo - (5*k - 2):, 2:, 2:] = (np.asarray(obj[1+zLo:1+5*k+3, 1:self.e+1, 1:self.e+1]) == 1)
+        return slab
+
+    #voxels block row k was last scored with
+    def scoredRow(self, k):
+        if k in self.rows:
+            return self.rows[k]
+        if k in self.changed:
+            raise ValueError("block row {} changed and is no longer kept, pass the whole volume to update".format(k))
+        return self.rowVoxels(self.obj, k)
+
+    #block rows holding inner layers lo..hi-1
+    def rowRange(self, lo, hi):
+        return range((lo + 2) // 5, (hi + 1) // 5 + 1)
+
+    #rescore the blocks holding voxels of layers zLo..zHi-1 that differ from the last scored volume
+    def update(self, obj, zLo, zHi):
+        lo = max(zLo - 1, 0)
+        hi = min(zHi - 1, self.e)
+        for k in (self.rowRange(lo, hi) if hi > lo else ()):
+            self.rescore(k, self.rowVoxels(obj, k), self.rows.get(k))
+        return self.total
+
+    #set layers zLo.. to layers, (k, size, size) arrays of inner voxels, and rescore the blocks that changed
+    def setLayers(self, zLo, layers):
+        lo = max(zLo - 1, 0)
+        hi = min(zLo - 1 + len(layers), self.e)
+        for k in (self.rowRange(lo, hi) if hi > lo else ()):
+            old = self.scoredRow(k)
+            cur = old.copy()
+            l0, l1 = max(lo, 5*k - 2), min(hi, 5*k + 3)
+            cur[l0-(5*k-2):l1-(5*k-2), 2:, 2:] = (np.asarray(layers[l0-zLo+1:l1-zLo+1])[:, :self.e, :self.e] == 1)
+            self.rescore(k, cur, old, slice(l0-(5*k-2), l1-(5*k-2)))
+        return self.total
+
+    #rescore the blocks of row k where cur, its new voxels, differs from old (every block when old is None)
+    #in the layers of the row that may have changed
+    def rescore(self, k, cur, old, layers=slice(None)):
+        n = self.n
+        if old is None and k not in self.changed:
+            old = self.rowVoxels(self.obj, k)
+        if old is None:
+            bx, by = np.nonzero(np.ones((n, n), dtype=bool))
+        else:
+            x, y = np.nonzero((cur[layers] != old[layers]).any(axis=0))
+            bx, by = np.unravel_index(np.unique(x // 5 * n + y // 5), (n, n))
+        self.rows[k] = cur
+        self.rows.move_to_end(k)
+        while len(self.rows) > self.keepRows:
+            self.dropRow(next(iter(self.rows)))
+            self.rows.popitem(last=False)
+        if len(bx) == 0:
+            return self.total
+        self.changed.add(k)
+        blocks = cur.reshape(5, n, 5, n, 5).transpose(1, 3, 0, 2, 4)[bx, by]
+        newStr = self.scoreChanged(k, bx, by, blocks)
+        if k < self.m:
+            counted = (bx < self.m) & (by < self.m)
+            self.total += np.sum((newStr - self.grid[k, bx, by])[counted])
+        self.grid[k, bx, by] = newStr
+        return self.total
+
+    #printing only moves forward, so everything between the last checked layer and layer z may have changed
+    def advance(self, obj, z):
+        total = self.update(obj, self.dirtyFrom, z+1)
+        self.dirtyFrom = z
+        return total
+
+#attach to a shared volume made by SharedVolume, the creating process stays responsible for unlinking it
+#(workers share its resource tracker, where registering the name again is a no-op)
+def attachShared(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+#copy of a (size+2)^3 volume in shared memory, one byte per voxel, filled a layer at a time so any volume kind works
+class SharedVolume:
+    def __init__( self, obj, size ):
+        self.shape = (size + 2, size + 2, size + 2)
+        self.shm   = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)))
+        arr = np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf)
+        for z in range(size + 2):
+            arr[z] = np.asarray(obj[z]) == 1
+        del arr
+
+    def close( self ):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+#worker task: block rows k0..k1 of a shared volume, the slab read is layers 5*k0-2 .. 5*k1-3 so it
+#carries the 2 voxel halo below its first block row
+def sharedBlockRows(name, shape, size, k0, k1):
+    shm = attachShared(name)
+    try:
+        obj = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        ret = scoreBlocks(extractBlocks(obj, size, k0, k1))
+        del obj
+    finally:
+        shm.close()
+    return k0, ret
+
+#process pool scoring z-slabs of block rows, the volume goes to the workers through shared memory
+#and only the per slab block strength grids come back, keep one around to avoid starting workers per call
+class ParallelStr:
+    def __init__( self, workers=None ):
+        self.workers = workers or os.cpu_count()
+        resource_tracker.ensure_running()       # started before the workers so they share it
+        self.pool    = multiprocessing.Pool(self.workers)
+
+    def blockStrGrid( self, obj, size ):
+        n = blockCount(size)
+        grid = np.zeros((n,n,n), dtype=int)
+        if n == 0:
+            return grid
+        rows = max(1, min(-(-n // (4*self.workers)), batchVoxels // (125*n*n)))
+        with SharedVolume(obj, size) as vol:
+            tasks = [ (vol.shm.name, vol.shape, size, k0, min(n, k0+rows)) for k0 in range(0, n, rows) ]
+            for k0, part in self.pool.starmap(sharedBlockRows, tasks):
+                grid[k0:k0+len(part)] = part
+        return grid
+
+    def objStr( self, obj, size ):
+        return reduceStr(self.blockStrGrid(obj, size))
+
+    def close( self ):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+#get the strength of a full object with a pool of worker processes
+def parallelObjStr(obj, size, workers=None):
+    with ParallelStr(workers) as par:
+        return par.objStr(obj, size)
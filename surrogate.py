@@ -0,0 +1,154 @@
+import numpy as np
+import network
+import strength
+
+#largest strength a 5x5x5 block can have, every voxel filled with all of its neighbours inside the block or wrapped
+maxBlockStr = 125 * int(strength.kernel.sum())
+
+#learned stand in for getStr5by5: a Network mapping the 125 voxels of a block (flattened z,x,y) to its strength
+#divided by scale, margin is the largest block error seen on held out blocks when it was trained
+class StrSurrogate:
+    def __init__( self, net, scale=maxBlockStr, margin=float(maxBlockStr) ):
+        self.net    = net
+        self.scale  = scale
+        self.margin = margin
+
+    #predicted strength of a stack of blocks shaped (...,5,5,5), one batched pass through the network
+    def blockStr(self, blocks):
+        blocks = np.asarray(blocks)
+        lead = blocks.shape[:-3]
+        X = (blocks.reshape(-1, 125) == 1).T.astype(self.net.dtype)
+        if X.shape[1] == 0:
+            return np.zeros(lead)
+        return (self.net.feedforward(X)[0] * self.scale).reshape(lead)
+
+    #block strength grid of a volume a few block rows at a time like strength.blockStrGrid, blocks the cache
+    #knows keep their exact strength and the others are estimated, returns (grid, which blocks were estimated)
+    def estimateGrid(self, obj, size, cache="default"):
+        n = strength.blockCount(size)
+        grid = np.zeros((n,n,n), dtype=int)
+        estimated = np.zeros((n,n,n), dtype=bool)
+        step = max(1, strength.batchVoxels // (125*n*n)) if n else 1
+        for k0 in range(0, n, step):
+            k1 = min(n, k0 + step)
+            blocks = strength.extractBlocks(obj, size, k0, k1)
+            vals, found = strength.knownBlocks(blocks, cache)
+            vals[~found] = np.rint(self.blockStr(blocks[~found]))
+            grid[k0:k1] = vals
+            estimated[k0:k1] = ~found
+        return grid, estimated
+
+    def objStr(self, obj, size):
+        return float(strength.reduceStr(self.estimateGrid(obj, size)[0]))
+
+    def save(self, path):
+        self.net.save(path, scale=np.array(self.scale), margin=np.array(self.margin))
+
+def loadSurrogate(path):
+    net = network.load(path)
+    with np.load(path) as data:
+        return StrSurrogate(net, float(data['scale']), float(data['margin']))
+
+#distinct blocks of some volumes, plus blocks filled at random over a range of densities so the network sees more
+#than the handful of patterns periodic infill repeats
+def trainingBlocks(volumes, size, randomBlocks=20000, rng=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    n = strength.blockCount(size)
+    parts = [ strength.extractBlocks(v, size, 0, n).reshape(-1, 125) for v in volumes ]
+    density = rng.random((randomBlocks, 1))
+    parts.append((rng.random((randomBlocks, 125)) < density).astype(np.int8))
+    return np.unique(np.concatenate(parts).astype(np.int8), axis=0).reshape(-1, 5, 5, 5)
+
+#train a surrogate on blocks labelled by the exact kernel, a tenth of them held out to measure margin
+def trainSurrogate(blocks, hidden=100, epochs=100, mini_batch_size=32, eta=.02, rng=None, dtype=np.float32):
+    if rng is None:
+        rng = np.random.default_rng()
+    blocks = np.asarray(blocks)[rng.permutation(len(blocks))]
+    labels = strength.str5by5Batch(blocks)
+    held = max(1, len(blocks) // 10)
+    net = network.Network([125, hidden, 1], dtype=dtype)
+    for w in net.weights:
+        w /= np.sqrt(w.shape[1])        # keep the first activations small so no layer starts out all zero
+    net.biases[-1][:] = .5
+    sur = StrSurrogate(net)
+    X, Y = net.as_matrices(((blocks[held:].reshape(-1, 125) == 1).T, (labels[held:] / sur.scale)[None,:]))
+    for j in range(epochs):
+        net.train_chunk(X, Y, mini_batch_size, eta)
+    sur.margin = float(np.max(np.abs(sur.blockStr(blocks[:held]) - labels[:held])))
+    return sur
+
+#IncrementalStr for the build simulations that scores no block the cache has not seen unless a decision needs it:
+#the reference grid and every rescored block take the cached strength when there is one and the network's
+#estimate otherwise. a block that never changed adds the same value to refTotal and total, so only changed
+#blocks carry error into the loss, margin (plus rounding) for each side of one that was estimated. a loss the
+#bound cannot place clearly outside the 0 < loss < strThresh window has those blocks scored exactly first
+#rows that are no longer kept have their estimates replaced right away, their voxels are not read back later
+class ScreenedStr(strength.IncrementalStr):
+    def __init__( self, sur, obj, size, cache="default" ):
+        self.sur = sur
+        n = strength.blockCount(size)
+        self.moved     = np.zeros((n,n,n), dtype=bool)      # blocks rescored since the reference
+        self.uncertain = 0                                  # estimated sides of the counted moved blocks
+        super().__init__(obj, size, cache)
+        self.refGrid      = self.grid.astype(np.int32)      # reference strengths, to correct refTotal
+        self.refEstimated = self.estimated.copy()
+        self.exactBlocks  = 0                               # blocks scored exactly for a decision or a dropped row
+
+    def initialGrid(self, obj):
+        grid, self.estimated = self.sur.estimateGrid(obj, self.size, self.cache)
+        return grid
+
+    def counted(self, k, bx, by):
+        return (k < self.m) & (bx < self.m) & (by < self.m)
+
+    def scoreChanged(self, k, bx, by, blocks):
+        vals, found = strength.knownBlocks(blocks, self.cache)
+        vals[~found] = np.rint(self.sur.blockStr(blocks[~found]))
+        counted = self.counted(k, bx, by)
+        moved = self.moved[k, bx, by]
+        self.uncertain += int(np.count_nonzero(counted & ~moved & self.refEstimated[k, bx, by]))
+        self.uncertain += int(np.count_nonzero(counted & ~found)) - int(np.count_nonzero(counted & moved & self.estimated[k, bx, by]))
+        self.moved[k, bx, by] = True
+        self.estimated[k, bx, by] = ~found
+        return vals
+
+    #replace the estimates of the counted blocks (bx, by) of row k by exact strengths, voxels being the row's
+    #current voxels, and with ref also those of the reference
+    def settle(self, k, bx, by, voxels, ref):
+        n = self.n
+        counted = self.counted(k, bx, by)
+        cur = self.estimated[k, bx, by] & counted
+        if cur.any():
+            blocks = voxels.reshape(5, n, 5, n, 5).transpose(1, 3, 0, 2, 4)[bx[cur], by[cur]]
+            exact = strength.scoreBlocks(blocks, self.cache)
+            self.total += np.sum(exact - self.grid[k, bx[cur], by[cur]])
+            self.grid[k, bx[cur], by[cur]] = exact
+            self.estimated[k, bx[cur], by[cur]] = False
+            self.uncertain -= len(exact)
+            self.exactBlocks += len(exact)
+        old = self.refEstimated[k, bx, by] & counted if ref else np.zeros(len(bx), dtype=bool)
+        if old.any():
+            blocks = self.rowVoxels(self.obj, k).reshape(5, n, 5, n, 5).transpose(1, 3, 0, 2, 4)[bx[old], by[old]]
+            exact = strength.scoreBlocks(blocks, self.cache)
+            self.refTotal += np.sum(exact - self.refGrid[k, bx[old], by[old]])
+            self.refGrid[k, bx[old], by[old]] = exact
+            self.refEstimated[k, bx[old], by[old]] = False
+            self.uncertain -= len(exact)
+            self.exactBlocks += len(exact)
+
+    def dropRow(self, k):
+        bx, by = np.nonzero(self.moved[k] & self.estimated[k])
+        self.settle(k, bx, by, self.rows[k], False)
+
+    def loss(self, strThresh):
+        est = self.refTotal - self.total
+        bound = (self.sur.margin + .5) * self.uncertain
+        if self.uncertain == 0:
+            return est, True
+        if est + bound <= 0 or est - bound >= strThresh:
+            return est, False
+        for k in np.unique(np.nonzero(self.moved & (self.estimated | self.refEstimated))[0]):
+            bx, by = np.nonzero(self.moved[k] & (self.estimated[k] | self.refEstimated[k]))
+            self.settle(k, bx, by, self.rows.get(k), True)
+        return self.refTotal - self.total, True
@@ -0,0 +1,138 @@
+import hashlib
+import inspect
+import itertools
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+import zlib
+import numpy as np
+import checker
+import infill
+import strength
+import voxels
+
+#generated volumes are kept here bit-packed, one .npy file per parameter tuple
+cacheDir = os.path.join(os.path.expanduser('~'), '.cache', 'infillcache')
+
+#one row per finished (cell, trial), a sweep rerun with the same seed skips every row already present
+resultsSchema = '''CREATE TABLE IF NOT EXISTS results (
+    pattern TEXT NOT NULL, size INTEGER NOT NULL, density REAL NOT NULL, params TEXT NOT NULL,
+    seed INTEGER NOT NULL, trial INTEGER NOT NULL,
+    strength INTEGER, cost INTEGER, flaws INTEGER, corrected INTEGER, seconds REAL,
+    PRIMARY KEY (pattern, size, density, params, seed, trial))'''
+resultColumns = ('pattern', 'size', 'density', 'params', 'seed', 'trial', 'strength', 'cost', 'flaws', 'corrected', 'seconds')
+
+#extra parameters a registered pattern takes after size and density
+def patternParams(name):
+    return list(inspect.signature(infill.infillPatterns[name]).parameters)[2:]
+
+#every cell of the grid as (pattern, size, density, params), params being sorted (name, value) pairs
+#each pattern only sweeps the extra parameters it takes, so rect ignores slope values meant for grid
+def sweepCells(patterns, sizes, densities, **params):
+    cells = []
+    for name in patterns:
+        extra = patternParams(name)
+        missing = [ p for p in extra if p not in params ]
+        if missing:
+            raise ValueError("no values given for {} of pattern {}".format(", ".join(missing), name))
+        for size, density, *values in itertools.product(sizes, densities, *(params[p] for p in extra)):
+            cells.append((name, int(size), float(density), tuple(zip(extra, (float(v) for v in values)))))
+    return cells
+
+def paramsText(params):
+    return json.dumps(dict(params), sort_keys=True)
+
+#generator of one trial of a cell, derived from the cell itself so results do not depend on the grid it came from
+def cellRng(seed, cell, trial):
+    pattern, size, density, params = cell
+    key = zlib.crc32('{}|{}|{!r}|{}'.format(pattern, size, density, paramsText(params)).encode('utf-8'))
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(key, trial)))
+
+def volumeFile(cell, directory):
+    name = hashlib.sha1(repr(cell).encode('utf-8')).hexdigest()
+    return os.path.join(directory, name+'.npy')
+
+#volume of a cell as a uint8 array, generated once and loaded from the cache afterwards
+def cellVolume(cell, directory=None):
+    pattern, size, density, params = cell
+    path = volumeFile(cell, directory or cacheDir)
+    if os.path.exists(path):
+        return voxels.PackedVolume(data=np.load(path), length=size+2).toArray(np.uint8)
+    obj = infill.buildInfill(pattern, size, density, kind="uint8", **dict(params))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path+'.{}.tmp'.format(os.getpid())
+    with open(tmp, 'wb') as f:
+        np.save(f, np.packbits(obj != 0, axis=-1))
+    os.replace(tmp, path)
+    return obj
+
+#strength of a cell's volume and a simulated build for each of trials
+def runCell(cell, trials, seed, directory):
+    obj = cellVolume(cell, directory)
+    size = cell[1]
+    str = int(strength.objStr(obj, size))
+    rows = []
+    for trial in trials:
+        t = time.perf_counter()
+        cost, flaws, corrected = checker.buildObject(obj, size, rng=cellRng(seed, cell, trial), verbose=False)
+        rows.append((trial, str, int(cost), int(flaws), int(corrected), time.perf_counter() - t))
+    return cell, rows
+
+def runCellArgs(args):
+    return runCell(*args)
+
+def openResults(path):
+    db = sqlite3.connect(path)
+    db.execute(resultsSchema)
+    return db
+
+#trials of every cell that have no row in the results store yet
+def pendingTrials(db, cells, trials, seed):
+    done = set(db.execute('SELECT pattern, size, density, params, trial FROM results WHERE seed = ?', (seed,)))
+    ret = []
+    for cell in cells:
+        pattern, size, density, params = cell
+        left = [ t for t in range(trials) if (pattern, size, density, paramsText(params), t) not in done ]
+        if left:
+            ret.append((cell, left))
+    return ret
+
+#run every cell of the grid trials times on a process pool and record each result in the sqlite file at path
+#cells are written as they finish, so an interrupted sweep picks up where it stopped when run again
+#extra pattern parameters are given as lists by name (slope=[...] for grid), returns the number of trials run
+def runSweep(path, patterns, sizes, densities, trials=1, seed=0, workers=None, directory=None, **params):
+    cells = sweepCells(patterns, sizes, densities, **params)
+    db = openResults(path)
+    try:
+        todo = pendingTrials(db, cells, trials, seed)
+        todo.sort(key=lambda c: -c[0][1])      # largest volumes first so the pool does not end on one big cell
+        if not todo:
+            return 0
+        ran = 0
+        workers = min(workers or os.cpu_count(), len(todo))
+        with multiprocessing.Pool(workers) as pool:
+            for cell, rows in pool.imap_unordered(runCellArgs, [ (cell, left, seed, directory) for cell, left in todo ]):
+                pattern, size, density, params = cell
+                db.executemany('INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                               [ (pattern, size, density, paramsText(params), seed) + row for row in rows ])
+                db.commit()
+                ran += len(rows)
+        return ran
+    finally:
+        db.close()
+
+#rows of the results store as dicts, optionally only those of one seed
+def loadResults(path, seed=None):
+    db = openResults(path)
+    try:
+        query = 'SELECT {} FROM results'.format(', '.join(resultColumns))
+        args = ()
+        if seed is not None:
+            query += ' WHERE seed = ?'
+            args = (seed,)
+        rows = db.execute(query + ' ORDER BY pattern, size, density, params, seed, trial', args).fetchall()
+    finally:
+        db.close()
+    return [ dict(zip(resultColumns, row)) for row in rows ]
@@ -0,0 +1,82 @@
+import numpy as np
+
+#ray sample points sit slightly off the voxel centers so a ray never runs exactly along a shared triangle edge
+rayJitter = (0.000123456, 0.000654321)
+
+#triangles of a mesh (WavefrontOBJ or objio.ObjArrays) as an (T,3) array of vertex ids, polygons with more sides are split into a fan like load_obj(triangulate=True)
+def meshTriangles(obj):
+    if hasattr(obj, 'triangles'):
+        return obj.triangles().astype(np.int64)
+    tris = []
+    for poly in obj.polygons:
+        for i in range(2, len(poly)):
+            tris.append((poly[0][0], poly[i-1][0], poly[i][0]))
+    return np.array(tris, dtype=np.int64).reshape(-1, 3)
+
+#voxel counts along x, y, z when the longest side of the mesh gets size voxels, plus the scale to voxel units
+def meshGrid(verts, size):
+    lo = verts.min(axis=0)
+    extent = verts.max(axis=0) - lo
+    scale = size / max(extent.max(), 1e-12)
+    dims = np.minimum(np.ceil(extent * scale - 1e-9).astype(int), size)
+    return lo, scale, np.maximum(dims, 1)
+
+#inside/outside mask of a closed mesh as a (size+2)^3 volume indexed [z][x][y] like the infill generators
+#rays are cast along z through every (x,y) column, each triangle fills the columns under it in one batch
+#and a voxel is inside when an odd number of crossings lie below its center
+def voxelize(obj, size, batchPairs=1 << 22):
+    verts = np.asarray(obj.vertices, dtype=np.float64)[:, :3]
+    tris = meshTriangles(obj)
+    mask = np.zeros((size + 2, size + 2, size + 2), dtype=bool)
+    if len(tris) == 0:
+        return mask
+    lo, scale, (nx, ny, nz) = meshGrid(verts, size)
+    p = (verts - lo) * scale
+    a, b, c = p[tris[:,0]], p[tris[:,1]], p[tris[:,2]]
+    d = (b[:,0]-a[:,0])*(c[:,1]-a[:,1]) - (c[:,0]-a[:,0])*(b[:,1]-a[:,1])
+    keep = np.abs(d) > 1e-12                # triangles seen edge on never cross a z ray
+    a, b, c, d = a[keep], b[keep], c[keep], d[keep]
+    jx, jy = rayJitter
+    xs = np.stack((a[:,0], b[:,0], c[:,0]))
+    ys = np.stack((a[:,1], b[:,1], c[:,1]))
+    ix0 = np.maximum(np.ceil(xs.min(axis=0) - 0.5 - jx).astype(np.int64), 0)
+    ix1 = np.minimum(np.floor(xs.max(axis=0) - 0.5 - jx).astype(np.int64), nx - 1)
+    iy0 = np.maximum(np.ceil(ys.min(axis=0) - 0.5 - jy).astype(np.int64), 0)
+    iy1 = np.minimum(np.floor(ys.max(axis=0) - 0.5 - jy).astype(np.int64), ny - 1)
+    w = np.maximum(ix1 - ix0 + 1, 0)
+    h = np.maximum(iy1 - iy0 + 1, 0)
+    pairs = w * h
+    crossings = np.zeros((nx, ny, nz + 1), dtype=np.uint8)
+    ends = np.cumsum(pairs)
+    t0 = 0
+    while t0 < len(pairs):
+        t1 = max(int(np.searchsorted(ends, ends[t0] - pairs[t0] + batchPairs, side='right')), t0 + 1)
+        sel = slice(t0, t1)
+        n = pairs[sel]
+        rep = np.repeat(np.arange(t1 - t0), n)
+        local = np.arange(int(n.sum())) - np.repeat(np.cumsum(n) - n, n)
+        hh = h[sel][rep]
+        cx = ix0[sel][rep] + local // np.maximum(hh, 1)
+        cy = iy0[sel][rep] + local % np.maximum(hh, 1)
+        sx = cx + 0.5 + jx
+        sy = cy + 0.5 + jy
+        ta, tb, tc, td = a[sel][rep], b[sel][rep], c[sel][rep], d[sel][rep]
+        l1 = ((sx-ta[:,0])*(tc[:,1]-ta[:,1]) - (tc[:,0]-ta[:,0])*(sy-ta[:,1])) / td
+        l2 = ((tb[:,0]-ta[:,0])*(sy-ta[:,1]) - (sx-ta[:,0])*(tb[:,1]-ta[:,1])) / td
+        l0 = 1 - l1 - l2
+        hit = (l0 >= 0) & (l1 >= 0) & (l2 >= 0)
+        zc = l0[hit]*ta[hit,2] + l1[hit]*tb[hit,2] + l2[hit]*tc[hit,2]
+        k = np.clip(np.ceil(zc - 0.5), 0, nz).astype(np.int64)
+        ids, counts = np.unique(np.ravel_multi_index((cx[hit], cy[hit], k), crossings.shape), return_counts=True)
+        crossings.flat[ids] ^= (counts & 1).astype(np.uint8)
+        t0 = t1
+    inside = np.bitwise_xor.accumulate(crossings, axis=2)[:, :, :nz].astype(bool)
+    mask[1:nz+1, 1:nx+1, 1:ny+1] = inside.transpose(2, 0, 1)
+    return mask
+
+#clear every infill voxel outside the mesh, one layer at a time so any volume kind works
+def fillMesh(obj, infill, size):
+    mask = voxelize(obj, size)
+    for z in range(size + 2):
+        infill[z] = np.asarray(infill[z]) * mask[z]
+    return infill
@@ -0,0 +1,340 @@
+import numpy as np
+import collections
+import os
+import shutil
+import tempfile
+import weakref
+
+#number of set bits in every byte value
+popcountTable = np.unpackbits(np.arange(256, dtype=np.uint8)[:,None], axis=1).sum(axis=1).astype(np.uint8)
+
+#turn an index into a full tuple with one entry per axis
+def fullKey(key, ndim):
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(k is Ellipsis for k in key):
+        i = key.index(Ellipsis)
+        key = key[:i] + (slice(None),) * (ndim - len(key) + 1) + key[i+1:]
+    if len(key) > ndim:
+        raise IndexError("too many indices for volume")
+    return key + (slice(None),) * (ndim - len(key))
+
+def isFullSlice(k):
+    return isinstance(k, slice) and k == slice(None)
+
+def isIndex(k):
+    return isinstance(k, (int, np.integer))
+
+#voxel volume storing one bit per voxel, packed along the last (y) axis with np.packbits
+#supports the same chained and tuple indexing as the int arrays checker.py builds, indexing
+#that keeps the y axis whole returns a view, everything else is returned unpacked as uint8
+class PackedVolume:
+    def __init__( self, shape=None, data=None, length=None ):
+        if data is None:
+            shape = tuple(int(s) for s in shape)
+            length = shape[-1]
+            data = np.zeros(shape[:-1] + ((length + 7) // 8,), dtype=np.uint8)
+        self.data   = data          # packed bytes, shape is shape[:-1] + (ceil(length/8),)
+        self.length = length        # voxels along the packed axis
+
+    @classmethod
+    def fromArray( cls, arr ):
+        arr = np.asarray(arr)
+        return cls(data=np.packbits(arr != 0, axis=-1), length=arr.shape[-1])
+
+    @property
+    def shape(self):
+        return self.data.shape[:-1] + (self.length,)
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint8)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def bitIndex(self, y):
+        if y < 0:
+            y += self.length
+        if y < 0 or y >= self.length:
+            raise IndexError("index out of range for volume")
+        return y >> 3, np.uint8(0x80 >> (y & 7))
+
+    def __getitem__(self, key):
+        key = fullKey(key, self.ndim)
+        lead, last = key[:-1], key[-1]
+        if isFullSlice(last):
+            return PackedVolume(data=self.data[lead], length=self.length)
+        if isIndex(last) and all(isIndex(k) for k in lead):
+            byte, mask = self.bitIndex(int(last))
+            return int((self.data[lead + (byte,)] & mask) != 0)
+        return np.unpackbits(self.data[lead], axis=-1, count=self.length)[..., last]
+
+    def __setitem__(self, key, value):
+        key = fullKey(key, self.ndim)
+        lead, last = key[:-1], key[-1]
+        if isIndex(last) and all(isIndex(k) for k in lead) and np.ndim(value) == 0:
+            byte, mask = self.bitIndex(int(last))
+            if value:
+                self.data[lead + (byte,)] |= mask
+            else:
+                self.data[lead + (byte,)] &= ~mask
+            return
+        if isFullSlice(last):
+            if isinstance(value, PackedVolume) and value.length == self.length:
+                self.data[lead] = value.data
+            else:
+                bits = np.broadcast_to(np.asarray(value) != 0, self.data[lead].shape[:-1] + (self.length,))
+                self.data[lead] = np.packbits(bits, axis=-1)
+            return
+        bits = np.unpackbits(self.data[lead], axis=-1, count=self.length)
+        bits[..., last] = np.asarray(value) != 0
+        self.data[lead] = np.packbits(bits, axis=-1)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = np.unpackbits(self.data, axis=-1, count=self.length)
+        return arr if dtype is None else arr.astype(dtype)
+
+    def toArray(self, dtype=int):
+        return np.asarray(self, dtype=dtype)
+
+    def copy(self):
+        return PackedVolume(data=self.data.copy(), length=self.length)
+
+    #number of filled voxels, counted on the packed bytes
+    def count(self):
+        return int(np.sum(popcountTable[self.data], dtype=np.int64))
+
+    def sum(self, axis=None, dtype=None, out=None):
+        if axis is None and out is None:
+            return self.count()
+        return np.sum(np.asarray(self), axis=axis, dtype=dtype, out=out)
+
+    #number of voxels that differ from another volume of the same shape
+    def diff(self, other):
+        if isinstance(other, PackedVolume) and other.shape == self.shape:
+            return int(np.sum(popcountTable[self.data ^ other.data], dtype=np.int64))
+        return int(np.count_nonzero(np.asarray(self) != (np.asarray(other) != 0)))
+
+#voxel volume kept on disk as z-slab chunks, each one a np.memmap file loaded on first use
+#at most cacheChunks chunks stay mapped, the least recently used one is flushed if dirty and unmapped
+#indexing a single layer returns a writable view of its chunk so chained writes like obj[z][x][y] = 1 land on disk
+#(the map is shared, so they reach the file without marking the chunk dirty). a chunk that was never written is
+#held in memory as zeros until it is evicted or flushed and only gets a file if it holds something by then,
+#so reading never allocates disk
+class ChunkedVolume:
+    def __init__( self, shape, directory=None, chunkLayers=8, cacheChunks=16, dtype=np.uint8 ):
+        self.shape       = tuple(int(s) for s in shape)
+        self.chunkLayers = chunkLayers
+        self.cacheChunks = cacheChunks
+        self.dtype       = np.dtype(dtype)
+        self.cache       = collections.OrderedDict()    # chunk id -> memmap, in least recently used order
+        self.dirty       = set()                        # chunk ids written since they were last flushed
+        self.pending     = set()                        # chunk ids held in memory only, they have no file yet
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='voxels-')
+            weakref.finalize(self, shutil.rmtree, directory, True)
+        self.directory   = directory
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def nchunks(self):
+        return (self.shape[0] + self.chunkLayers - 1) // self.chunkLayers
+
+    def __len__(self):
+        return self.shape[0]
+
+    def chunkPath(self, cid):
+        return os.path.join(self.directory, 'chunk-{:05d}.dat'.format(cid))
+
+    def chunkShape(self, cid):
+        layers = min(self.chunkLayers, self.shape[0] - cid * self.chunkLayers)
+        return (layers,) + self.shape[1:]
+
+    #chunk cid, mapped from its file or held in memory, returns None for a chunk that was never written unless
+    #create is set, then it starts as zeros in memory
+    def chunk(self, cid, create=False):
+        if cid in self.cache:
+            self.cache.move_to_end(cid)
+            return self.cache[cid]
+        path = self.chunkPath(cid)
+        if os.path.exists(path):
+            mm = np.memmap(path, dtype=self.dtype, mode='r+', shape=self.chunkShape(cid))
+        elif create:
+            mm = np.zeros(self.chunkShape(cid), dtype=self.dtype)
+            self.pending.add(cid)
+        else:
+            return None
+        self.cache[cid] = mm
+        while len(self.cache) > self.cacheChunks:
+            self.evict(next(iter(self.cache)))
+        return mm
+
+    #give a chunk held in memory its file when it holds something, returns whether it did
+    def store(self, cid):
+        arr = self.cache[cid]
+        if not arr.any():
+            return False
+        arr.tofile(self.chunkPath(cid))
+        self.pending.discard(cid)
+        return True
+
+    def evict(self, cid):
+        if cid in self.pending:
+            self.store(cid)
+        elif cid in self.dirty:
+            self.cache[cid].flush()
+        self.cache.pop(cid)
+        self.pending.discard(cid)
+        self.dirty.discard(cid)
+
+    def layerIndex(self, z):
+        if z < 0:
+            z += self.shape[0]
+        if z < 0 or z >= self.shape[0]:
+            raise IndexError("index out of range for volume")
+        return z
+
+    #view of layer z, the chunk is not marked dirty
+    def view(self, z):
+        z = self.layerIndex(z)
+        cid = z // self.chunkLayers
+        return self.chunk(cid, create=True)[z - cid * self.chunkLayers]
+
+    #writable view of layer z for a write, marks its chunk dirty
+    def layer(self, z):
+        z = self.layerIndex(z)
+        cid = z // self.chunkLayers
+        mm = self.chunk(cid, create=True)
+        self.dirty.add(cid)
+        return mm[z - cid * self.chunkLayers]
+
+    #read layers zs (a range) into one array, chunks that were never written read as zeros
+    def readLayers(self, zs, rest):
+        parts = []
+        for cid in range(zs.start // self.chunkLayers, (zs.stop - 1) // self.chunkLayers + 1):
+            c0 = cid * self.chunkLayers
+            lo, hi = max(zs.start, c0), min(zs.stop, c0 + self.chunkLayers)
+            mm = self.chunk(cid)
+            if mm is None:
+                parts.append(np.zeros((hi - lo,) + self.shape[1:], dtype=self.dtype)[(slice(None),) + rest])
+            else:
+                parts.append(np.array(mm[(slice(lo - c0, hi - c0),) + rest]))
+        return np.concatenate(parts)
+
+    def __getitem__(self, key):
+        key = fullKey(key, 3)
+        kz, rest = key[0], key[1:]
+        if isIndex(kz):
+            return self.view(int(kz))[rest]
+        zs = range(*kz.indices(self.shape[0]))
+        if len(zs) == 0:
+            return np.zeros((0,) + self.shape[1:], dtype=self.dtype)[(slice(None),) + rest]
+        if zs.step != 1:
+            return np.stack([self.readLayers(range(z, z+1), rest)[0] for z in zs])
+        return self.readLayers(zs, rest)
+
+    def __setitem__(self, key, value):
+        key = fullKey(key, 3)
+        kz, rest = key[0], key[1:]
+        if isIndex(kz):
+            self.layer(int(kz))[rest] = value
+            return
+        zs = range(*kz.indices(self.shape[0]))
+        if len(zs) == 0:
+            return
+        value = np.broadcast_to(np.asarray(value), (len(zs),) + self.layer(zs[0])[rest].shape)
+        for i, z in enumerate(zs):
+            self.layer(z)[rest] = value[i]
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self[:]
+        return arr if dtype is None else arr.astype(dtype)
+
+    #write every dirty chunk back to its file, chunks held in memory get a file if they hold something
+    def flush(self):
+        for cid in list(self.pending):
+            if self.store(cid):
+                self.cache[cid] = np.memmap(self.chunkPath(cid), dtype=self.dtype, mode='r+', shape=self.chunkShape(cid))
+        for cid in list(self.dirty):
+            if cid in self.cache:
+                self.cache[cid].flush()
+        self.dirty.clear()
+
+    def zerosLike(self):
+        return ChunkedVolume(self.shape, chunkLayers=self.chunkLayers, cacheChunks=self.cacheChunks, dtype=self.dtype)
+
+    def copy(self):
+        ret = self.zerosLike()
+        for z in range(self.shape[0]):
+            ret[z] = self[z]
+        return ret
+
+    #number of filled voxels, one chunk at a time
+    def count(self):
+        total = 0
+        for cid in range(self.nchunks):
+            mm = self.chunk(cid)
+            if mm is not None:
+                total += int(np.count_nonzero(mm))
+        return total
+
+    def sum(self, axis=None, dtype=None, out=None):
+        if axis is None and out is None:
+            total = 0
+            for cid in range(self.nchunks):
+                mm = self.chunk(cid)
+                if mm is not None:
+                    total += int(np.sum(mm, dtype=np.int64))
+            return total
+        return np.sum(np.asarray(self), axis=axis, dtype=dtype, out=out)
+
+#volume kinds a generator can allocate: the original int arrays, byte per voxel arrays, or bit-packed
+volumeKinds = {
+    "int":    lambda shape: np.zeros(shape, dtype=int),
+    "uint8":  lambda shape: np.zeros(shape, dtype=np.uint8),
+    "bool":   lambda shape: np.zeros(shape, dtype=bool),
+    "packed": lambda shape: PackedVolume(shape),
+    "chunked": lambda shape: ChunkedVolume(shape),
+}
+
+#allocate an empty volume, kind is a name from volumeKinds or a callable taking the shape
+def zeros(shape, kind="int"):
+    if callable(kind):
+        return kind(shape)
+    if kind not in volumeKinds:
+        raise ValueError("unknown volume kind {}".format(kind))
+    return volumeKinds[kind](shape)
+
+#allocate an empty volume with the same shape and storage as obj
+def zerosLike(obj):
+    if isinstance(obj, np.ndarray):
+        return np.zeros_like(obj)
+    if isinstance(obj, PackedVolume):
+        return PackedVolume(obj.shape)
+    return obj.zerosLike()
+
+#copy layers zLo..zHi-1 of src into dst, one layer at a time unless both are in memory
+def copyLayers(dst, src, zLo, zHi):
+    if isinstance(dst, np.ndarray) and isinstance(src, np.ndarray):
+        dst[zLo:zHi] = src[zLo:zHi]
+        return
+    for z in range(zLo, zHi):
+        dst[z] = src[z]
+
+#count filled voxels in any volume
+def count(obj):
+    if isinstance(obj, np.ndarray):
+        return int(np.count_nonzero(obj))
+    return obj.count()